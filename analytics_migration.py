@@ -2,20 +2,68 @@
 import sqlite3
 from config import DB_PATH
 
+PICK_SESSIONS_COLUMNS = "session_id, created_at, class_name, final_wins, final_losses, notes"
+
+def _create_pick_sessions_sql(table_name: str) -> str:
+    """pick_sessionsのCREATE文（主キーB-treeに行を直接格納）"""
+    return f"""
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            session_id TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            class_name TEXT,
+            final_wins INTEGER,
+            final_losses INTEGER,
+            notes TEXT,
+            PRIMARY KEY(session_id)
+        ) WITHOUT ROWID
+    """
+
+def _pick_sessions_has_rowid(conn: sqlite3.Connection) -> bool:
+    """pick_sessionsが移行前（rowid付き）のテーブルか"""
+    row = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'pick_sessions'"
+    ).fetchone()
+    return bool(row) and "WITHOUT ROWID" not in row[0].upper()
+
+def migrate_pick_sessions_without_rowid(conn: sqlite3.Connection) -> bool:
+    """既存のrowid付きpick_sessionsをWITHOUT ROWIDに作り直す（移行したらTrue）
+    
+    移行済みなら確認のみで終わる。複数プロセスから同時に呼ばれても1回だけ移行するよう、
+    書き込みロックを取ってからもう一度確認する。
+    """
+    if not _pick_sessions_has_rowid(conn):
+        return False
+    
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if not _pick_sessions_has_rowid(conn):
+            conn.execute("ROLLBACK")
+            return False
+        
+        conn.execute("DROP TABLE IF EXISTS pick_sessions_new")
+        conn.execute(_create_pick_sessions_sql("pick_sessions_new"))
+        conn.execute(f"""
+            INSERT INTO pick_sessions_new ({PICK_SESSIONS_COLUMNS})
+            SELECT {PICK_SESSIONS_COLUMNS} FROM pick_sessions
+            WHERE session_id IS NOT NULL
+        """)
+        conn.execute("DROP TABLE pick_sessions")
+        conn.execute("ALTER TABLE pick_sessions_new RENAME TO pick_sessions")
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    
+    print("pick_sessionsをWITHOUT ROWIDテーブルに移行しました")
+    return True
+
 def migrate_analytics_tables():
     """分析用テーブルを作成"""
     with sqlite3.connect(DB_PATH) as conn:
         # ピックセッション
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS pick_sessions (
-                session_id TEXT PRIMARY KEY,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                class_name TEXT,
-                final_wins INTEGER,
-                final_losses INTEGER,
-                notes TEXT
-            )
-        """)
+        migrate_pick_sessions_without_rowid(conn)
+        conn.execute(_create_pick_sessions_sql("pick_sessions"))
         
         # ピックログ
         conn.execute("""
@@ -49,8 +97,12 @@ def migrate_analytics_tables():
         """)
         
         # インデックス作成
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_pick_logs_session ON pick_logs(session_id)")
+        # (session_id, created_at) の複合インデックスがsession_id単独検索も兼ねる
+        conn.execute("DROP INDEX IF EXISTS idx_pick_logs_session")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_pick_logs_session_created ON pick_logs(session_id, created_at)")
         conn.execute("CREATE INDEX IF NOT EXISTS idx_pick_logs_created ON pick_logs(created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_pick_logs_chosen ON pick_logs(chosen_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_pick_logs_recommended ON pick_logs(recommended_id)")
         
         conn.commit()
         print("分析用テーブルの作成が完了しました")
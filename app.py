@@ -1,15 +1,31 @@
 # app.py
-from flask import Flask, render_template, request, jsonify, Response
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
+from flask.json.provider import JSONProvider
 import json
 import logging
-import subprocess
+import atexit
+import functools
+import queue
+import sqlite3
+import threading
 import os
+from concurrent.futures import Future
+from typing import Optional, Tuple
+import numpy as np
 from config import DB_PATH, CLASS_NAMES, LOG_FILE, LOG_LEVEL, APP_CONFIG
-from enhanced_advisor import EnhancedTwoPickAdvisor
+from cache_system import card_data_watcher, card_info_cache
+from enhanced_advisor import EnhancedTwoPickAdvisor, parse_deck_names
+from pick_advisor import PickAdvice, CardScoresView, warm_score_kernel
 from card_resolver import CardResolver
+from analytics_migration import migrate_pick_sessions_without_rowid
 from learning_system import LearningSystem
 from win_predictor import WinRatePredictor
 
+try:
+    import orjson
+except ImportError:  # orjson未導入環境では標準jsonを使用
+    orjson = None
+
 
 # ログ設定
 logging.basicConfig(
@@ -22,8 +38,286 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+
+def _advice_payload(advice: PickAdvice) -> dict:
+    """PickAdviceをAPI応答用の辞書に変換（スコアは丸め済み）"""
+    return {
+        'action': advice.action,
+        'recommended_card_id': advice.recommended_card_id,
+        'recommended_card_name': advice.recommended_card_name,
+        'confidence': round(advice.confidence, 1),
+        'reasoning': advice.reasoning,
+        'card_scores': _rounded_card_scores(advice.card_scores)
+    }
+
+def _json_default(obj):
+    """orjsonが直接扱えないオブジェクトを辞書に変換"""
+    if isinstance(obj, PickAdvice):
+        return _advice_payload(obj)
+    if isinstance(obj, CardScoresView):
+        return list(obj)
+    if hasattr(obj, '__dict__'):
+        return obj.__dict__
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+# PickAdviceはorjson標準のdataclass変換ではなく_json_defaultで変換する
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATACLASS if orjson is not None else 0
+
+def _dumps(obj) -> str:
+    """コンパクトなJSON文字列化（orjsonがあれば優先）"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default, option=ORJSON_OPTIONS).decode()
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_json_default)
+
+def _ndjson_line(obj) -> bytes:
+    """NDJSONの1行を生成"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default, option=ORJSON_OPTIONS) + b'\n'
+    return (_dumps(obj) + '\n').encode('utf-8')
+
+def _json_response(obj) -> Response:
+    """jsonifyを経由せずJSONレスポンスを生成"""
+    body = (orjson.dumps(obj, default=_json_default, option=ORJSON_OPTIONS)
+            if orjson is not None else _dumps(obj))
+    return Response(body, mimetype='application/json')
+
+class OrjsonProvider(JSONProvider):
+    """orjsonによるJSONプロバイダ（常にUTF-8出力）"""
+
+    def dumps(self, obj, **kwargs) -> str:
+        option = ORJSON_OPTIONS | orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys'):
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=_json_default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+def class_display_name(class_id) -> str:
+    """クラスIDから表示名を取得"""
+    if isinstance(class_id, int) and 0 <= class_id < len(CLASS_NAMES):
+        return CLASS_NAMES[class_id]
+    return '不明'
+
+
+# 表示・送信時に小数1桁へ丸めるスコア列
+SCORE_FIELDS = (
+    'base_score', 'curve_bonus', 'role_bonus', 'duplication_penalty',
+    'synergy_bonus', 'archetype_bonus', 'meta_bonus', 'final_score'
+)
+
+def _rounded_card_scores(card_scores: list) -> list:
+    """候補カードのスコア列をNumPyで一括して丸める"""
+    if not card_scores:
+        return []
+    values = np.round(np.array(
+        [[score.get(field, 0) for field in SCORE_FIELDS] for score in card_scores],
+        dtype=float
+    ), 1)
+    return [
+        {**score, **dict(zip(SCORE_FIELDS, row))}
+        for score, row in zip(card_scores, values.tolist())
+    ]
+
+# 入力フォームと同じ範囲（ピック番号1-15、リロール0-5）
+PICK_INDEX_RANGE = (1, 15)
+REROLLS_LEFT_RANGE = (0, 5)
+
+def _parse_int(value, default: int, lo: int, hi: int):
+    """整数パラメータを解析して範囲内に丸める（数値でなければNone）"""
+    if value is None or value == '':
+        return default
+    if isinstance(value, int) and not isinstance(value, bool):
+        number = value
+    else:
+        text = str(value).strip()
+        digits = text[1:] if text[:1] in '+-' else text
+        if not digits.isdecimal() or len(digits) > 9:
+            return None
+        number = int(text)
+    return max(lo, min(hi, number))
+
+
+class ExplainingConnection(sqlite3.Connection):
+    """デバッグ時にEXPLAIN QUERY PLANでフルスキャンを検出する接続"""
+    
+    _checked_sql: set = set()
+    
+    def execute(self, sql, parameters=()):
+        if app.debug and sql not in self._checked_sql:
+            self._checked_sql.add(sql)
+            self._warn_if_full_scan(sql, parameters)
+        return super().execute(sql, parameters)
+    
+    def _warn_if_full_scan(self, sql, parameters):
+        statement = sql.lstrip().upper()
+        if not statement.startswith(("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")):
+            return
+        try:
+            plan = super().execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+        except sqlite3.Error:
+            return
+        for row in plan:
+            if "SCAN" in row[3]:
+                logger.warning(f"インデックス未使用のクエリ: {row[3]} | {' '.join(sql.split())}")
+
+_tls = threading.local()
+
+def get_conn() -> sqlite3.Connection:
+    """スレッドごとのSQLite接続を取得（初回のみ接続・PRAGMA設定）"""
+    conn = getattr(_tls, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None,
+                               factory=ExplainingConnection)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA mmap_size=268435456")
+        conn.execute("PRAGMA cache_size=-65536")
+        _tls.conn = conn
+    return conn
+
+# sqlite3の接続単位ステートメントキャッシュを効かせるため定数として保持
+CARD_FULL_SQL = "SELECT * FROM card_full WHERE card_id = ?"
+
+# card_full未構築のDB向け（同じ列をJOINで取得）
+CARD_FULL_JOIN_SQL = """
+    SELECT c.*, m.base_rating, m.stat_efficiency, m.role_score,
+           m.keyword_score, m.rarity_bonus, m.impact_score
+    FROM cards c
+    LEFT JOIN card_metrics m ON c.card_id = m.card_id
+    WHERE c.card_id = ?
+"""
+
+# get_card_fullで使うSQL（起動時とカードデータ更新時にcard_fullの有無で選ぶ）
+_card_full_query = CARD_FULL_JOIN_SQL
+
+def _detect_card_full():
+    """card_fullテーブルの有無を確認し、get_card_fullのSQLを切り替える"""
+    global _card_full_query
+    exists = get_conn().execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'card_full'"
+    ).fetchone()
+    _card_full_query = CARD_FULL_SQL if exists else CARD_FULL_JOIN_SQL
+
+@functools.lru_cache(maxsize=4096)
+def get_card_full(card_id: str):
+    """カード情報とメトリクスを1クエリで取得（カードデータ更新までキャッシュ）"""
+    cursor = get_conn().execute(_card_full_query, (card_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    
+    columns = [desc[0] for desc in cursor.description]
+    card = dict(zip(columns, row))
+    card["roles"] = json.loads(card["roles"] or "[]")
+    card["keywords"] = json.loads(card["keywords"] or "[]")
+    return card
+
+
+# ピックログはキューに積み、バックグラウンドでまとめて書き込む（グループコミット）
+PICK_LOG_BATCH_SIZE = 100
+# 保存完了を待つ上限（秒）
+PICK_LOG_COMMIT_TIMEOUT = 5.0
+
+PICK_LOG_INSERT_SQL = """
+    INSERT INTO pick_logs 
+    (session_id, pick_index, rerolls_left, candidate1_id, candidate2_id,
+     recommended_id, chosen_id, action, scores_json, deck_snapshot)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# (行, 保存完了を通知するFuture)。Noneはワーカー停止の番兵
+_log_q: "queue.Queue[Optional[Tuple[tuple, Future]]]" = queue.Queue()
+
+def _drain(q: queue.Queue) -> Tuple[list, bool]:
+    """1件目は到着まで待ち、その時点で溜まっている分を最大PICK_LOG_BATCH_SIZE件まで取り出す
+    
+    番兵を受け取ったら(取り出し済みの分, True)を返す。
+    """
+    item = q.get()
+    if item is None:
+        return [], True
+    items = [item]
+    while len(items) < PICK_LOG_BATCH_SIZE:
+        try:
+            item = q.get_nowait()
+        except queue.Empty:
+            break
+        if item is None:
+            return items, True
+        items.append(item)
+    return items, False
+
+def _write_pick_logs(rows: list):
+    """ピックログを1トランザクションで一括保存"""
+    conn = get_conn()
+    conn.execute("BEGIN")
+    try:
+        # セッション作成（既存セッションは主キー制約で無視）
+        conn.executemany(
+            "INSERT OR IGNORE INTO pick_sessions (session_id) VALUES (?)",
+            [(session_id,) for session_id in {row[0] for row in rows if row[0]}]
+        )
+        
+        conn.executemany(PICK_LOG_INSERT_SQL, rows)
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+def _commit_pick_logs(items: list):
+    """一括保存し、待機中の各リクエストに結果を通知"""
+    try:
+        _write_pick_logs([row for row, _ in items])
+    except Exception as e:
+        logger.error(f"ピック記録保存エラー: {e}")
+        for _, future in items:
+            future.set_exception(e)
+    else:
+        for _, future in items:
+            future.set_result(None)
+
+def _pick_log_worker():
+    """ピックログ書き込みスレッド（番兵を受け取るまで動く）"""
+    while True:
+        items, stop = _drain(_log_q)
+        if items:
+            _commit_pick_logs(items)
+        if stop:
+            return
+
+_pick_log_thread = threading.Thread(target=_pick_log_worker, name="pick-log-writer", daemon=True)
+_pick_log_thread.start()
+
+@atexit.register
+def _flush_pick_logs():
+    """終了時にワーカーを止めてから、残ったピックログを保存"""
+    _log_q.put(None)
+    _pick_log_thread.join()
+    items = []
+    while True:
+        try:
+            item = _log_q.get_nowait()
+        except queue.Empty:
+            break
+        if item is not None:
+            items.append(item)
+    if items:
+        _commit_pick_logs(items)
+
+
 app = Flask(__name__)
-app.config['JSON_AS_ASCII'] = False
+if orjson is not None:
+    app.json = OrjsonProvider(app)
+else:
+    app.json.ensure_ascii = False
+# 整形・キーソートを行わない
+app.json.sort_keys = False
+app.json.compact = True
 
 # システム初期化
 advisor = EnhancedTwoPickAdvisor(db_path=DB_PATH)
@@ -31,6 +325,45 @@ resolver = CardResolver(db_path=DB_PATH)
 learning_system = LearningSystem()
 win_predictor = WinRatePredictor()
 
+# カードデータの版（CLIや他ワーカーでの再構築を検出してキャッシュを無効化する）
+card_data = card_data_watcher(DB_PATH)
+
+def _on_card_data_changed():
+    """カードデータ更新時にアプリ側のキャッシュを破棄"""
+    _detect_card_full()
+    get_card_full.cache_clear()
+
+_detect_card_full()
+card_data.register(_on_card_data_changed)
+
+# 旧スキーマのpick_sessionsは起動時に移行（移行済みならスキーマの確認のみ）
+try:
+    migrate_pick_sessions_without_rowid(get_conn())
+except sqlite3.Error as e:
+    logger.error(f"pick_sessionsの移行エラー: {e}")
+
+@app.before_request
+def _check_card_data():
+    card_data.check()
+
+def _warm_card_info_cache():
+    """カード情報キャッシュを事前読み込み"""
+    try:
+        count = advisor.warm_card_cache()
+        logger.info(f"カード情報キャッシュ読み込み完了: {count}枚")
+    except Exception as e:
+        logger.error(f"カード情報キャッシュ読み込みエラー: {e}")
+
+def _warm_up():
+    """起動直後の初回リクエストが読み込み・コンパイルを待たないよう事前に済ませる"""
+    _warm_card_info_cache()
+    try:
+        warm_score_kernel()
+    except Exception as e:
+        logger.error(f"スコア計算の事前コンパイルエラー: {e}")
+
+threading.Thread(target=_warm_up, name="card-cache-warmup", daemon=True).start()
+
 logger.info("シャドウバース 2Pickアドバイザー起動")
 
 
@@ -44,15 +377,10 @@ def search_suggestions():
     """検索候補API"""
     query = request.args.get('q', '').strip()
     if len(query) < 2:
-        return jsonify([])
+        return _json_response([])
     
-    suggestions = resolver.get_suggestions(query, limit=8)
-    
-    # クラス名を追加
-    for suggestion in suggestions:
-        suggestion['class_name'] = CLASS_NAMES.get(suggestion['class_id'], '不明')
-    
-    return jsonify(suggestions)
+    # クラス名はresolver側のSQLで付与済み
+    return _json_response(resolver.get_suggestions(query, limit=8))
 
 @app.route('/search', methods=['GET', 'POST'])
 def card_search():
@@ -65,26 +393,19 @@ def card_search():
         if query:
             card_id = resolver.resolve_card_id(query)
             if card_id:
-                card = advisor.get_card_info(card_id)
+                # カード情報とメトリクスをまとめて取得
+                card = get_card_full(card_id)
                 if card:
-                    # メトリクス情報も取得
-                    with sqlite3.connect(DB_PATH) as conn:
-                        cursor = conn.execute(
-                            "SELECT base_rating, stat_efficiency, role_score, keyword_score, impact_score FROM card_metrics WHERE card_id = ?",
-                            (card_id,)
-                        )
-                        metrics = cursor.fetchone()
-                    
                     card_info = {
                         'basic': card,
                         'metrics': {
-                            'base_rating': round(metrics[0], 1) if metrics and metrics[0] is not None else 50.0,
-                            'stat_efficiency': round(metrics[1], 1) if metrics and metrics[1] is not None else 0.0,
-                            'role_score': round(metrics[2], 1) if metrics and metrics[2] is not None else 0.0,
-                            'keyword_score': round(metrics[3], 1) if metrics and metrics[3] is not None else 0.0,
-                            'impact_score': round(metrics[4], 1) if metrics and metrics[4] is not None else 0.0
+                            'base_rating': round(card['base_rating'], 1) if card['base_rating'] is not None else 50.0,
+                            'stat_efficiency': round(card['stat_efficiency'], 1) if card['stat_efficiency'] is not None else 0.0,
+                            'role_score': round(card['role_score'], 1) if card['role_score'] is not None else 0.0,
+                            'keyword_score': round(card['keyword_score'], 1) if card['keyword_score'] is not None else 0.0,
+                            'impact_score': round(card['impact_score'], 1) if card['impact_score'] is not None else 0.0
                         },
-                        'class_display': CLASS_NAMES.get(card['class_id'], '不明')
+                        'class_display': class_display_name(card['class_id'])
                     }
                 else:
                     error_message = "カード情報の取得に失敗しました"
@@ -104,10 +425,12 @@ def pick_advice():
             candidate1 = request.form.get('candidate1', '').strip()
             candidate2 = request.form.get('candidate2', '').strip()
             deck_input = request.form.get('deck_input', '').strip()
-            pick_index = int(request.form.get('pick_index', 1))
-            rerolls_left = int(request.form.get('rerolls_left', 2))
+            pick_index = _parse_int(request.form.get('pick_index'), 1, *PICK_INDEX_RANGE)
+            rerolls_left = _parse_int(request.form.get('rerolls_left'), 2, *REROLLS_LEFT_RANGE)
             
-            if not candidate1 or not candidate2:
+            if pick_index is None or rerolls_left is None:
+                error_message = "ピック番号とリロール回数は数値で入力してください"
+            elif not candidate1 or not candidate2:
                 error_message = "候補カード2枚を入力してください"
             else:
                 result = advisor.get_pick_advice_by_names(
@@ -127,18 +450,63 @@ def pick_advice():
                         'action_text': 'リロール推奨' if advice.action == 'reroll' else f'{advice.recommended_card_name} を選択',
                         'confidence': round(advice.confidence, 1),
                         'reasoning': advice.reasoning,
-                        'card_scores': advice.card_scores,
+                        'card_scores': _rounded_card_scores(advice.card_scores),
                         'deck_info': f"デッキ: {result['resolved_deck_count']}/{result['original_deck_count']}枚解決",
                         'recommended_card_id': getattr(advice, 'recommended_card_id', '')
                     }
                 
-        except ValueError:
-            error_message = "ピック番号とリロール回数は数値で入力してください"
         except Exception as e:
             error_message = f"エラーが発生しました: {str(e)}"
     
     return render_template('advice.html', advice_result=advice_result, error_message=error_message, advisor=advisor)
 
+@app.route('/api/pick_advice', methods=['POST'])
+def api_pick_advice():
+    """2PickアドバイスAPI（NDJSONストリーム: 各カードのスコア → 最終行にサマリー）"""
+    data = request.get_json(silent=True) or request.form
+    candidate1 = str(data.get('candidate1', '')).strip()
+    candidate2 = str(data.get('candidate2', '')).strip()
+    deck_input = str(data.get('deck_input', '')).strip()
+    
+    pick_index = _parse_int(data.get('pick_index'), 1, *PICK_INDEX_RANGE)
+    rerolls_left = _parse_int(data.get('rerolls_left'), 2, *REROLLS_LEFT_RANGE)
+    if pick_index is None or rerolls_left is None:
+        return jsonify({'success': False, 'error': 'ピック番号とリロール回数は数値で入力してください'}), 400
+    
+    if not candidate1 or not candidate2:
+        return jsonify({'success': False, 'error': '候補カード2枚を入力してください'}), 400
+    
+    result = advisor.get_pick_advice_by_names(
+        candidate1=candidate1,
+        candidate2=candidate2,
+        deck_input=deck_input,
+        pick_index=pick_index,
+        rerolls_left=rerolls_left
+    )
+    if 'error' in result:
+        return jsonify({'success': False, 'error': result['error']}), 404
+    
+    # JSONを要求されたらPickAdviceごと一括で返す
+    if request.accept_mimetypes.best == 'application/json':
+        return _json_response(result)
+    
+    advice = result['advice']
+    
+    def generate():
+        for score in _rounded_card_scores(advice.card_scores):
+            yield _ndjson_line(score)
+        yield _ndjson_line({
+            'action': advice.action,
+            'recommended_card_id': advice.recommended_card_id,
+            'recommended_card_name': advice.recommended_card_name,
+            'confidence': round(advice.confidence, 1),
+            'reasoning': advice.reasoning,
+            'resolved_deck_count': result['resolved_deck_count'],
+            'original_deck_count': result['original_deck_count']
+        })
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/deck_analyzer', methods=['GET', 'POST'])
 def deck_analyzer():
     """デッキ分析ページ"""
@@ -168,15 +536,20 @@ def meta_info():
                          meta_info=meta, 
                          adjustments=adjustments)
                          
+# カード数とメトリクス数を1クエリで取得
+SYSTEM_STATS_SQL = """
+    SELECT (SELECT COUNT(*) FROM cards WHERE is_token = 0),
+           (SELECT COUNT(*) FROM card_metrics)
+"""
+
 @app.route('/system_stats')
 def system_stats():
     """システム統計ページ"""
     cache_stats = advisor.get_cache_stats()
     
     # データベース統計
-    with sqlite3.connect(advisor.db_path) as conn:
-        total_cards = conn.execute("SELECT COUNT(*) FROM cards WHERE is_token = 0").fetchone()[0]
-        total_metrics = conn.execute("SELECT COUNT(*) FROM card_metrics").fetchone()[0]
+    conn = get_conn()
+    total_cards, total_metrics = conn.execute(SYSTEM_STATS_SQL).fetchone()
     
     stats = {
         'database': {
@@ -194,6 +567,7 @@ def clear_cache():
     """キャッシュクリアAPI"""
     try:
         card_info_cache.clear()
+        get_card_full.cache_clear()
         return jsonify({'success': True, 'message': 'キャッシュをクリアしました'})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -204,42 +578,25 @@ def api_log_pick():
     data = request.json or {}
     
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            # セッション確認・作成
-            session_id = data.get('session_id')
-            if session_id:
-                cursor = conn.execute(
-                    "SELECT session_id FROM pick_sessions WHERE session_id = ?",
-                    (session_id,)
-                )
-                if not cursor.fetchone():
-                    conn.execute(
-                        "INSERT INTO pick_sessions (session_id) VALUES (?)",
-                        (session_id,)
-                    )
-            
-            # ピックログ記録
-            conn.execute("""
-                INSERT INTO pick_logs 
-                (session_id, pick_index, rerolls_left, candidate1_id, candidate2_id,
-                 recommended_id, chosen_id, action, scores_json, deck_snapshot)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                session_id,
-                data.get('pick_index'),
-                data.get('rerolls_left'),
-                data.get('candidate1_id'),
-                data.get('candidate2_id'),
-                data.get('recommended_id'),
-                data.get('chosen_id'),
-                data.get('action'),
-                json.dumps(data.get('scores', []), ensure_ascii=False),
-                json.dumps(data.get('deck_snapshot', []), ensure_ascii=False)
-            ))
-            
-            conn.commit()
-            
-        logger.info(f"ピック記録保存: session={session_id}, action={data.get('action')}")
+        session_id = data.get('session_id')
+        
+        # ピックログ記録（書き込みはバックグラウンドで他のリクエスト分とまとめて実行）
+        saved = Future()
+        _log_q.put(((
+            session_id,
+            data.get('pick_index'),
+            data.get('rerolls_left'),
+            data.get('candidate1_id'),
+            data.get('candidate2_id'),
+            data.get('recommended_id'),
+            data.get('chosen_id'),
+            data.get('action'),
+            _dumps(data.get('scores', [])),
+            _dumps(data.get('deck_snapshot', []))
+        ), saved))
+        saved.result(timeout=PICK_LOG_COMMIT_TIMEOUT)
+        
+        logger.info(f"ピック記録完了: session={session_id}, action={data.get('action')}")
         return jsonify({"success": True})
         
     except Exception as e:
@@ -269,12 +626,8 @@ def win_prediction():
             analysis = advisor.get_deck_analysis_detailed(deck_input)
             
             # カードIDリスト作成
-            deck_ids = []
-            deck_names = [name.strip() for name in deck_input.replace('、', ',').split(',')]
-            for name in deck_names:
-                card_id = advisor.resolver.resolve_card_id(name)
-                if card_id:
-                    deck_ids.append(card_id)
+            deck_names = parse_deck_names(deck_input)
+            deck_ids = [card_id for card_id in advisor.resolver.resolve_card_ids_batch(deck_names) if card_id]
             
             # 勝率予測
             prediction = win_predictor.predict_win_rate(deck_ids, analysis)
@@ -282,48 +635,51 @@ def win_prediction():
     
     return render_template('win_prediction.html', prediction_result=prediction_result)
 
-@app.route('/update_card_data', methods=['POST'])
-def update_card_data():
-    """カードデータ更新処理"""
-    logger.info("カードデータ更新リクエスト受信")
-    
+_update_lock = threading.Lock()
+
+def _run_card_data_update():
+    """カードデータとメトリクスをプロセス内で再構築"""
     try:
-        # shadowverse_db_builder.py を実行
-        result = subprocess.run(
-            ["python", "shadowverse_db_builder.py"],
-            capture_output=True,
-            text=True,
-            check=True,
-            timeout=300  # 5分でタイムアウト
-        )
+        # requests等の依存を起動時に読み込まないよう遅延インポート
+        import shadowverse_db_builder
+        import build_card_metrics
+        
+        shadowverse_db_builder.main()
         
         # メトリクス再構築
-        subprocess.run(
-            ["python", "build_card_metrics.py"],
-            capture_output=True,
-            text=True,
-            check=True,
-            timeout=60
-        )
+        build_card_metrics.main()
         
-        logger.info("カードデータ更新完了")
-        return jsonify({
-            'success': True, 
-            'message': 'カードデータとメトリクスの更新が完了しました'
-        })
+        # 登録済みの無効化処理（各キャッシュの破棄・読み込み直し）をすぐに実行
+        card_data.check(force=True)
+        _warm_card_info_cache()
         
-    except subprocess.TimeoutExpired:
-        logger.error("カードデータ更新がタイムアウトしました")
-        return jsonify({
-            'success': False, 
-            'message': 'カードデータ更新がタイムアウトしました'
-        }), 500
-    except subprocess.CalledProcessError as e:
-        logger.error(f"カードデータ更新エラー: {e.stderr}")
+        logger.info("カードデータ更新完了")
+    except Exception as e:
+        logger.error(f"カードデータ更新エラー: {e}")
+    finally:
+        _update_lock.release()
+
+@app.route('/update_card_data', methods=['POST'])
+def update_card_data():
+    """カードデータ更新処理（バックグラウンド実行）"""
+    logger.info("カードデータ更新リクエスト受信")
+    
+    if not _update_lock.acquire(blocking=False):
         return jsonify({
             'success': False, 
-            'message': f'更新エラー: {e.stderr}'
-        }), 500
+            'message': 'カードデータ更新は既に実行中です'
+        }), 409
+    
+    threading.Thread(target=_run_card_data_update, name="card-data-update", daemon=True).start()
+    return jsonify({
+        'success': True, 
+        'message': 'カードデータとメトリクスの更新を開始しました'
+    }), 202
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    app.run(
+        host=APP_CONFIG['host'],
+        port=APP_CONFIG['port'],
+        debug=APP_CONFIG['debug'],
+        threaded=APP_CONFIG['threaded']
+    )
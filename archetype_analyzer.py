@@ -2,8 +2,16 @@
 import sqlite3
 import json
 import re
+from collections import Counter
 from typing import Dict, List, Any, Optional, Tuple
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from cache_system import SimpleCache, card_data_watcher
+
+# 信頼度 = min(MAX_CONFIDENCE, スコア × CONFIDENCE_PER_SCORE)
+MAX_CONFIDENCE = 90
+CONFIDENCE_PER_SCORE = 8
+# これ以上スコアが伸びても信頼度が変わらない値
+SATURATED_SCORE = -(-MAX_CONFIDENCE // CONFIDENCE_PER_SCORE)
 
 @dataclass
 class Archetype:
@@ -13,11 +21,68 @@ class Archetype:
     ideal_curve: Dict[int, int]
     strategy_description: str
     min_cards_threshold: int
+    key_regex: re.Pattern = field(init=False, repr=False)
+
+    def __post_init__(self):
+        # キーパターンを1つの選択正規表現にまとめ、1回の走査で判定する
+        self.key_regex = re.compile(
+            "|".join(f"(?:{p})" for p in self.key_patterns), re.IGNORECASE
+        )
 
 class ArchetypeAnalyzer:
     def __init__(self, db_path: str = "shadowverse_cards.db"):
         self.db_path = db_path
         self.archetypes = self._initialize_archetypes()
+        
+        # クラス別・名前別の索引
+        self._archetypes_by_class: Dict[int, List[Archetype]] = {}
+        for archetype in self.archetypes:
+            self._archetypes_by_class.setdefault(archetype.class_id, []).append(archetype)
+        self._archetypes_by_name = {a.name: a for a in self.archetypes}
+        self._card_cache = self._load_card_cache()
+        # デッキ構成（入力順）→分析結果
+        self._deck_cache = SimpleCache(max_size=64, ttl_seconds=600)
+        # カードデータの版が変わったら読み込み直す
+        self.card_data = card_data_watcher(db_path)
+        self.card_data.register(self.refresh)
+
+    def _load_card_cache(self) -> Dict[str, Dict[str, Any]]:
+        """判定に使うカード情報を全件読み込み（card_id→カード情報）
+        
+        cardsテーブル未作成のDBでは空で返す（構築後はCardDataWatcher経由のrefreshで読み込む）。
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            try:
+                cursor = conn.execute("""
+                    SELECT card_id, name, class_id, cost, skill_text, evo_skill_text
+                    FROM cards
+                """)
+            except sqlite3.OperationalError:
+                return {}
+            cards = {
+                row[0]: {
+                    'name': row[1],
+                    'class_id': row[2],
+                    'cost': row[3],
+                    'skill_text': row[4] or '',
+                    'evo_skill_text': row[5] or '',
+                    # パターン判定用の結合テキストは読み込み時に1回だけ作る
+                    'text': f"{row[4] or ''} {row[5] or ''}"
+                }
+                for row in cursor
+            }
+        
+        # 各カードが一致するアーキタイプを読み込み時に判定しておく
+        for card in cards.values():
+            card['archetypes'] = frozenset(
+                a.name for a in self.archetypes if a.key_regex.search(card['text'])
+            )
+        return cards
+
+    def refresh(self):
+        """カードデータ更新後にカード情報を読み込み直す"""
+        self._card_cache = self._load_card_cache()
+        self._deck_cache.clear()
 
     def _initialize_archetypes(self) -> List[Archetype]:
         """アーキタイプ定義"""
@@ -107,50 +172,53 @@ class ArchetypeAnalyzer:
         if not card_ids:
             return {"detected_archetype": None, "confidence": 0, "recommendations": []}
 
-        # カード情報取得
+        self.card_data.check()
+        # 主要クラスの同数判定が入力順に依存するためタプルをキーにする
+        deck_key = tuple(card_ids)
+        cached = self._deck_cache.get(deck_key)
+        if cached is not None:
+            return cached
+        
+        result = self._analyze_deck_archetype(card_ids)
+        self._deck_cache.set(deck_key, result)
+        return result
+
+    def _analyze_deck_archetype(self, card_ids: List[str]) -> Dict[str, Any]:
+        """デッキのアーキタイプを分析（キャッシュなし）"""
+        # 入力順・重複枚数を保ってデッキを復元
         cards = []
-        class_counts = {}
+        class_counts = Counter()
         
-        with sqlite3.connect(self.db_path) as conn:
-            for card_id in card_ids:
-                cursor = conn.execute("""
-                    SELECT name, class_id, cost, skill_text, evo_skill_text
-                    FROM cards WHERE card_id = ?
-                """, (card_id,))
-                row = cursor.fetchone()
-                if row:
-                    cards.append({
-                        'name': row[0],
-                        'class_id': row[1],
-                        'cost': row[2],
-                        'skill_text': row[3] or '',
-                        'evo_skill_text': row[4] or ''
-                    })
-                    class_counts[row[1]] = class_counts.get(row[1], 0) + 1
+        for card_id in card_ids:
+            card = self._card_cache.get(card_id)
+            if card:
+                cards.append(card)
+                class_counts[card['class_id']] += 1
 
         if not cards:
             return {"detected_archetype": None, "confidence": 0, "recommendations": []}
 
         # 主要クラス特定（空の場合の安全処理）
-        main_class = max(class_counts.keys(), key=lambda x: class_counts[x]) if class_counts else 0
+        main_class = class_counts.most_common(1)[0][0] if class_counts else 0
 
         # アーキタイプスコア計算
         best_archetype = None
         best_score = 0
         
-        for archetype in self.archetypes:
-            if archetype.class_id != main_class:
-                continue
-                
+        candidates = self._archetypes_by_class.get(main_class, [])
+        
+        for index, archetype in enumerate(candidates):
+            # 最後の候補は採用と信頼度上限が確定した時点で走査を打ち切れる
+            is_last = index == len(candidates) - 1
             score = 0
             matching_cards = 0
             
             for card in cards:
-                card_text = f"{card['skill_text']} {card['evo_skill_text']}"
-                for pattern in archetype.key_patterns:
-                    if re.search(pattern, card_text, re.IGNORECASE):
-                        score += 2
-                        matching_cards += 1
+                if archetype.name in card['archetypes']:
+                    score += 2
+                    matching_cards += 1
+                    if (is_last and score >= SATURATED_SCORE and score > best_score
+                            and matching_cards >= archetype.min_cards_threshold):
                         break
             
             if matching_cards >= archetype.min_cards_threshold and score > best_score:
@@ -160,7 +228,7 @@ class ArchetypeAnalyzer:
         # 推奨事項生成
         recommendations = self._generate_recommendations(cards, best_archetype)
         
-        confidence = min(90, best_score * 8) if best_archetype else 0
+        confidence = min(MAX_CONFIDENCE, best_score * CONFIDENCE_PER_SCORE) if best_archetype else 0
 
         return {
             "detected_archetype": best_archetype.name if best_archetype else None,
@@ -178,10 +246,7 @@ class ArchetypeAnalyzer:
         recommendations = [f"戦略: {archetype.strategy_description}"]
         
         # マナカーブチェック
-        current_curve = {}
-        for card in cards:
-            cost = min(card['cost'], 6)
-            current_curve[cost] = current_curve.get(cost, 0) + 1
+        current_curve = Counter(min(card['cost'], 6) for card in cards)
         
         for cost, ideal_count in archetype.ideal_curve.items():
             current_count = current_curve.get(cost, 0)
@@ -193,33 +258,26 @@ class ArchetypeAnalyzer:
         return recommendations
 
     def calculate_archetype_bonus(self, candidate_card_id: str, 
-                                deck_card_ids: List[str]) -> Tuple[float, List[str]]:
-        """候補カードのアーキタイプボーナス"""
+                                deck_card_ids: List[str],
+                                archetype_analysis: Optional[Dict[str, Any]] = None) -> Tuple[float, List[str]]:
+        """候補カードのアーキタイプボーナス（archetype_analysisは分析済みなら渡す）"""
         if not deck_card_ids:
             return 0.0, []
 
         # デッキアーキタイプ分析
-        archetype_analysis = self.analyze_deck_archetype(deck_card_ids)
+        if archetype_analysis is None:
+            archetype_analysis = self.analyze_deck_archetype(deck_card_ids)
         detected_archetype = archetype_analysis.get("detected_archetype")
         
         if not detected_archetype:
             return 0.0, []
 
-        # 候補カード情報取得
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute("""
-                SELECT name, skill_text, evo_skill_text
-                FROM cards WHERE card_id = ?
-            """, (candidate_card_id,))
-            row = cursor.fetchone()
-            
-            if not row:
-                return 0.0, []
-            
-            candidate_text = f"{row[1] or ''} {row[2] or ''}"
+        candidate = self._card_cache.get(candidate_card_id)
+        if not candidate:
+            return 0.0, []
 
         # アーキタイプ情報取得
-        archetype = next((a for a in self.archetypes if a.name == detected_archetype), None)
+        archetype = self._archetypes_by_name.get(detected_archetype)
         if not archetype:
             return 0.0, []
 
@@ -227,10 +285,8 @@ class ArchetypeAnalyzer:
         bonus = 0.0
         reasons = []
         
-        for pattern in archetype.key_patterns:
-            if re.search(pattern, candidate_text, re.IGNORECASE):
-                bonus += 8.0
-                reasons.append(f"{detected_archetype}キーカード (+8.0点)")
-                break
+        if archetype.name in candidate['archetypes']:
+            bonus += 8.0
+            reasons.append(f"{detected_archetype}キーカード (+8.0点)")
         
-        return round(bonus, 1), reasons
+        return bonus, reasons
@@ -3,15 +3,44 @@ import sqlite3
 import json
 import re
 import logging
-from typing import Dict, List, Any
+import functools
+from bisect import bisect_right
+from typing import Dict, List, Any, Optional
+from pick_advisor import write_card_snapshot
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 DB_PATH = "shadowverse_cards.db"
 
+# 即時効果判定パターン（除去系・ドロー系を1回の走査で判定）
+IMPACT_PATTERN = re.compile(r"(?P<damage>破壊|消滅|ダメージ)|(?P<draw>ドロー|引く)")
+IMPACT_GROUP_SCORES = {"damage": 8, "draw": 5}
+
+def scan_impact_groups(texts: List[str]) -> List[frozenset]:
+    """全カードのテキストを連結し、即時効果キーワードを1回の走査で検出"""
+    # パターンは改行を含まないため、連結境界をまたいで一致することはない
+    starts = []
+    offset = 0
+    for text in texts:
+        starts.append(offset)
+        offset += len(text) + 1
+    
+    groups = [set() for _ in texts]
+    for match in IMPACT_PATTERN.finditer("\n".join(texts)):
+        groups[bisect_right(starts, match.start()) - 1].add(match.lastgroup)
+    return [frozenset(g) for g in groups]
+
+@functools.lru_cache(maxsize=None)
+def decode_tag_set(raw: Optional[str]) -> frozenset:
+    """roles/keywordsのJSON配列を集合に変換（同じ文字列は1回だけ解析）"""
+    return frozenset(json.loads(raw or "[]"))
+
 class CardMetricsBuilder:
     def __init__(self):
+        # 構築処理全体で1つの接続を使い回す
+        self.conn = sqlite3.connect(DB_PATH)
+        
         # 基本評価重み
         self.rarity_bonus = {
             "bronze": 0, "silver": 5, "gold": 10, "legendary": 15
@@ -33,6 +62,10 @@ class CardMetricsBuilder:
             "ドレイン": 6, "ファンファーレ": 3, "ラストワード": 3
         }
         
+        # 重み付け対象の集合（積集合で該当要素だけを取り出す）
+        self._role_keys = frozenset(self.role_weights)
+        self._keyword_keys = frozenset(self.keyword_weights)
+        
         # コスト別期待ステータス（攻撃力+体力）
         self.expected_stats = {
             1: 2, 2: 4, 3: 6, 4: 8, 5: 10, 6: 12, 7: 14, 8: 16, 9: 18, 10: 20
@@ -40,7 +73,7 @@ class CardMetricsBuilder:
 
     def create_metrics_table(self):
         """メトリクステーブル作成"""
-        with sqlite3.connect(DB_PATH) as conn:
+        with self.conn as conn:
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS card_metrics (
                     card_id TEXT PRIMARY KEY,
@@ -65,7 +98,7 @@ class CardMetricsBuilder:
 
     def load_cards(self) -> List[Dict[str, Any]]:
         """カードデータを読み込み"""
-        with sqlite3.connect(DB_PATH) as conn:
+        with self.conn as conn:
             cursor = conn.execute("""
                 SELECT card_id, name, class_id, class_name, cost, card_type, 
                        rarity, attack, defense, is_token, roles, keywords, skill_text
@@ -77,9 +110,9 @@ class CardMetricsBuilder:
             
             for row in cursor.fetchall():
                 card = dict(zip(columns, row))
-                # JSON文字列をリストに変換
-                card["roles"] = json.loads(card["roles"] or "[]")
-                card["keywords"] = json.loads(card["keywords"] or "[]")
+                # JSON文字列を集合に変換（スコア計算は積集合で行う）
+                card["roles"] = decode_tag_set(card["roles"])
+                card["keywords"] = decode_tag_set(card["keywords"])
                 cards.append(card)
             
             return cards
@@ -97,18 +130,13 @@ class CardMetricsBuilder:
 
     def calculate_role_score(self, card: Dict[str, Any]) -> float:
         """役割スコアを計算"""
-        score = 0.0
-        for role in card["roles"]:
-            if role in self.role_weights:
-                score += self.role_weights[role]
-        return score
+        role_weights = self.role_weights
+        return sum((role_weights[role] for role in card["roles"] & self._role_keys), 0.0)
 
     def calculate_keyword_score(self, card: Dict[str, Any]) -> float:
         """キーワードスコアを計算"""
-        score = 0.0
-        for keyword in card["keywords"]:
-            if keyword in self.keyword_weights:
-                score += self.keyword_weights[keyword]
+        keyword_weights = self.keyword_weights
+        score = sum((keyword_weights[kw] for kw in card["keywords"] & self._keyword_keys), 0.0)
         
         # クラス特有の補正
         if card["class_id"] == 4 and "覚醒" in card["keywords"]:  # Dragon
@@ -126,17 +154,18 @@ class CardMetricsBuilder:
             score += 8
         
         # 疾走・突進は即時影響
-        keywords = set(card["keywords"])
+        keywords = card["keywords"]
         if "疾走" in keywords:
             score += 10
         elif "突進" in keywords:
             score += 6
         
-        # テキストから即時効果を判定
-        if re.search(r"(破壊|消滅|ダメージ)", skill_text):
-            score += 8
-        if re.search(r"(ドロー|引く)", skill_text):
-            score += 5
+        # テキストから即時効果を判定（一括走査済みならその結果を使う）
+        matched = card.get("impact_groups")
+        if matched is None:
+            matched = scan_impact_groups([skill_text])[0]
+        for group in matched:
+            score += IMPACT_GROUP_SCORES[group]
         
         # 重いカードで即時影響がない場合はペナルティ
         if card["cost"] >= 6 and score == 0:
@@ -190,28 +219,44 @@ class CardMetricsBuilder:
         self.create_metrics_table()
         cards = self.load_cards()
         
-        with sqlite3.connect(DB_PATH) as conn:
-            for card in cards:
-                metrics = self.calculate_base_rating(card)
-                
-                conn.execute("""
-                    INSERT OR REPLACE INTO card_metrics 
-                    (card_id, base_rating, stat_efficiency, role_score, 
-                     keyword_score, rarity_bonus, impact_score, notes, updated_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                """, (
-                    card["card_id"], metrics["base_rating"], 
-                    metrics["stat_efficiency"], metrics["role_score"],
-                    metrics["keyword_score"], metrics["rarity_bonus"],
-                    metrics["impact_score"], metrics["notes"]
-                ))
+        # 即時効果キーワードは全カードまとめて1回で走査
+        impact_groups = scan_impact_groups([card["skill_text"] or "" for card in cards])
+        for card, groups in zip(cards, impact_groups):
+            card["impact_groups"] = groups
+        
+        # 全カード分の行を先に計算し、executemanyで一括書き込み
+        calculate = self.calculate_base_rating
+        rows = []
+        for card in cards:
+            metrics = calculate(card)
+            rows.append((
+                card["card_id"], metrics["base_rating"], 
+                metrics["stat_efficiency"], metrics["role_score"],
+                metrics["keyword_score"], metrics["rarity_bonus"],
+                metrics["impact_score"], metrics["notes"]
+            ))
+        
+        with self.conn as conn:
+            # 一括書き込み中はfsyncを減らし、1トランザクションで確定
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("BEGIN")
+            conn.executemany("""
+                INSERT OR REPLACE INTO card_metrics 
+                (card_id, base_rating, stat_efficiency, role_score, 
+                 keyword_score, rarity_bonus, impact_score, notes, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """, rows)
             
             conn.commit()
             logger.info(f"{len(cards)}枚のカードメトリクスを構築しました")
 
+    def build_card_full_table(self):
+        """カード情報とメトリクスを結合した検索用テーブルを再構築"""
+        build_card_full_table(self.conn)
+
     def show_top_cards(self, limit: int = 10):
         """上位評価カードを表示"""
-        with sqlite3.connect(DB_PATH) as conn:
+        with self.conn as conn:
             cursor = conn.execute("""
                 SELECT c.name, c.class_name, c.cost, c.card_type, m.base_rating
                 FROM card_metrics m
@@ -225,9 +270,36 @@ class CardMetricsBuilder:
             for name, class_name, cost, card_type, rating in cursor.fetchall():
                 print(f"{name} ({class_name}, {cost}コスト, {card_type}): {rating:.1f}点")
 
+def build_card_full_table(conn: sqlite3.Connection):
+    """カード情報とメトリクスを結合した検索用テーブルを再構築（カード・メトリクスどちらの更新後も呼ぶ）"""
+    with conn:
+        # cards.base_ratingはメトリクス側の値で置き換える
+        card_columns = [
+            row[1] for row in conn.execute("PRAGMA table_info(cards)")
+            if row[1] != "base_rating"
+        ]
+        select_columns = ", ".join(f"c.{column}" for column in card_columns)
+        
+        conn.execute("BEGIN")
+        conn.execute("DROP TABLE IF EXISTS card_full")
+        conn.execute(f"""
+            CREATE TABLE card_full AS
+            SELECT {select_columns}, m.base_rating, m.stat_efficiency, m.role_score,
+                   m.keyword_score, m.rarity_bonus, m.impact_score
+            FROM cards c
+            LEFT JOIN card_metrics m ON c.card_id = m.card_id
+        """)
+        conn.execute("CREATE UNIQUE INDEX idx_card_full_card_id ON card_full(card_id)")
+        conn.commit()
+        logger.info("card_fullテーブルを再構築しました")
+
 def main():
     builder = CardMetricsBuilder()
     builder.build_all_metrics()
+    builder.build_card_full_table()
+    # 評価値が変わるのでアドバイザー用スナップショットも書き出し直す
+    snapshot_count = write_card_snapshot(DB_PATH)
+    logger.info(f"カードスナップショットを書き出しました: {snapshot_count}枚")
     builder.show_top_cards(15)
 
 if __name__ == "__main__":
@@ -1,47 +1,77 @@
 # cache_system.py
+import os
 import time
-from typing import Dict, Any, Optional, Tuple
+import logging
+import sqlite3
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Hashable, List, Optional, Tuple
 from functools import wraps
 
+logger = logging.getLogger(__name__)
+
+# カードデータの版（件数と最終更新時刻）。ピックログの書き込みでは変わらない
+CARD_FINGERPRINT_SQL = """
+    SELECT (SELECT COUNT(*) || ':' || IFNULL(MAX(updated_at), '') FROM cards),
+           (SELECT COUNT(*) || ':' || IFNULL(MAX(updated_at), '') FROM card_metrics)
+"""
+
+# カードデータの版を確認する間隔（秒）
+CARD_DATA_CHECK_INTERVAL = 5.0
+
 class SimpleCache:
     """シンプルなメモリキャッシュシステム"""
     
-    def __init__(self, max_size: int = 500, ttl_seconds: int = 300):
+    def __init__(self, max_size: int = 500, ttl_seconds: Optional[float] = 300):
         self.max_size = max_size
         self.ttl_seconds = ttl_seconds
-        self.cache: Dict[str, Tuple[Any, float]] = {}
+        # 末尾ほど最近使われたエントリ（LRU）
+        self.cache: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
         self.access_count = {'hits': 0, 'misses': 0}
+        self._lock = threading.Lock()
     
-    def get(self, key: str) -> Optional[Any]:
+    def get(self, key: Hashable) -> Optional[Any]:
         """キャッシュから値を取得"""
-        if key in self.cache:
-            value, timestamp = self.cache[key]
+        with self._lock:
+            entry = self.cache.get(key)
+            if entry is not None:
+                value, timestamp = entry
+                
+                # TTL確認（Noneなら期限なし）
+                if self.ttl_seconds is None or time.time() - timestamp <= self.ttl_seconds:
+                    self.cache.move_to_end(key)
+                    self.access_count['hits'] += 1
+                    return value
+                else:
+                    del self.cache[key]
             
-            # TTL確認
-            if time.time() - timestamp <= self.ttl_seconds:
-                self.access_count['hits'] += 1
-                return value
-            else:
-                del self.cache[key]
-        
-        self.access_count['misses'] += 1
-        return None
+            self.access_count['misses'] += 1
+            return None
+    
+    def __contains__(self, key: Hashable) -> bool:
+        """有効なエントリがあるか（統計・LRU順は変えない）"""
+        with self._lock:
+            entry = self.cache.get(key)
+            if entry is None:
+                return False
+            return self.ttl_seconds is None or time.time() - entry[1] <= self.ttl_seconds
     
-    def set(self, key: str, value: Any):
+    def set(self, key: Hashable, value: Any):
         """キャッシュに値を設定"""
-        # サイズ制限
-        if len(self.cache) >= self.max_size:
-            # 古いエントリを削除（簡易LRU）
-            oldest_key = min(self.cache.keys(), 
-                           key=lambda k: self.cache[k][1])
-            del self.cache[oldest_key]
-        
-        self.cache[key] = (value, time.time())
+        with self._lock:
+            self.cache[key] = (value, time.time())
+            self.cache.move_to_end(key)
+            
+            # サイズ制限（最も長く使われていないエントリを削除）
+            if len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
     
     def clear(self):
         """キャッシュをクリア"""
-        self.cache.clear()
-        self.access_count = {'hits': 0, 'misses': 0}
+        with self._lock:
+            self.cache.clear()
+            self.access_count = {'hits': 0, 'misses': 0}
     
     def get_stats(self) -> Dict[str, Any]:
         """キャッシュ統計を取得"""
@@ -55,13 +85,17 @@ class SimpleCache:
             'total_requests': total
         }
 
+def method_cache_key(key_prefix: str, func_name: str, args: tuple,
+                     kwargs: Optional[Dict[str, Any]] = None) -> Hashable:
+    """cached_methodと同じ形式のキャッシュキーを生成（引数タプルをそのまま使う）"""
+    return (key_prefix, func_name, args, tuple(sorted(kwargs.items())) if kwargs else ())
+
 def cached_method(cache_instance: SimpleCache, key_prefix: str = ""):
     """メソッドキャッシュデコレータ"""
     def decorator(func):
         @wraps(func)
         def wrapper(self, *args, **kwargs):
-            # キャッシュキーを生成
-            cache_key = f"{key_prefix}_{func.__name__}_{hash(str(args))}"
+            cache_key = method_cache_key(key_prefix, func.__name__, args, kwargs)
             
             # キャッシュから取得を試行
             cached_result = cache_instance.get(cache_key)
@@ -79,5 +113,86 @@ def cached_method(cache_instance: SimpleCache, key_prefix: str = ""):
         return wrapper
     return decorator
 
+class CardDataWatcher:
+    """カードデータの版を一定間隔で確認し、変わっていたら登録済みの無効化処理を呼ぶ
+    
+    CLIでの再構築や他のワーカープロセスでの更新も、DBの版が変わることで検出する。
+    """
+    
+    def __init__(self, db_path: str, interval: float = CARD_DATA_CHECK_INTERVAL):
+        self.db_path = db_path
+        self.interval = interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], Optional[Callable[[], Any]]]] = []
+        self._next_check = time.monotonic() + interval
+        self.fingerprint = self.read_fingerprint()
+    
+    def _conn(self) -> sqlite3.Connection:
+        """スレッドごとの読み取り専用SQLite接続を取得（初回のみ接続）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA query_only=1")
+            self._local.conn = conn
+        return conn
+    
+    def read_fingerprint(self) -> Optional[Tuple[str, str]]:
+        """現在のカードデータの版（テーブル未作成ならNone）"""
+        try:
+            return tuple(self._conn().execute(CARD_FINGERPRINT_SQL).fetchone())
+        except sqlite3.OperationalError:
+            return None
+    
+    def register(self, callback: Callable[[], Any]):
+        """版が変わったときに呼ぶ処理を登録（バウンドメソッドは弱参照で持つ）"""
+        if hasattr(callback, '__func__'):
+            ref = weakref.WeakMethod(callback)
+        else:
+            ref = lambda: callback
+        with self._lock:
+            self._callbacks.append(ref)
+    
+    def check(self, force: bool = False) -> bool:
+        """前回の確認から一定時間経っていれば版を確認し、変わっていれば登録済みの処理を呼ぶ"""
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return False
+        
+        with self._lock:
+            if not force and now < self._next_check:
+                return False
+            self._next_check = now + self.interval
+            fingerprint = self.read_fingerprint()
+            if fingerprint == self.fingerprint:
+                return False
+            self.fingerprint = fingerprint
+            
+            # 破棄済みインスタンスの登録はここで取り除く
+            callbacks = [(ref, ref()) for ref in self._callbacks]
+            self._callbacks = [ref for ref, callback in callbacks if callback is not None]
+        
+        for _, callback in callbacks:
+            if callback is None:
+                continue
+            try:
+                callback()
+            except Exception:
+                logger.exception("カードデータ更新後の無効化処理でエラー")
+        return True
+
+_watchers: Dict[str, CardDataWatcher] = {}
+_watchers_lock = threading.Lock()
+
+def card_data_watcher(db_path: str) -> CardDataWatcher:
+    """DBごとに共有するCardDataWatcherを取得（同じDBのキャッシュは一度に無効化される）"""
+    key = os.path.abspath(db_path)
+    with _watchers_lock:
+        watcher = _watchers.get(key)
+        if watcher is None:
+            watcher = _watchers[key] = CardDataWatcher(db_path)
+        return watcher
+
 # グローバルキャッシュインスタンス
-card_info_cache = SimpleCache(max_size=1000, ttl_seconds=600)
+# カード情報はDBの版が変わったとき（CardDataWatcher経由）にクリアするため期限なしのLRUとする
+card_info_cache = SimpleCache(max_size=4096, ttl_seconds=None)
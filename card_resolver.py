@@ -1,60 +1,172 @@
 # card_resolver.py
 import sqlite3
-import re
+import functools
+import threading
 from typing import Optional, List, Dict, Any
+from config import CLASS_NAMES
+from cache_system import card_data_watcher
+
+try:
+    from rapidfuzz import process, fuzz
+except ImportError:  # rapidfuzz未導入環境では曖昧一致を行わない
+    process = None
+
+# 曖昧一致で採用する最低スコア（0-100）
+FUZZY_SCORE_CUTOFF = 80
+
+# クラス名をSQL側で付与するための静的CTE
+_CLASS_CTE = "WITH cls(id, name) AS (VALUES {})".format(
+    ", ".join("(?, ?)" for _ in CLASS_NAMES)
+)
+_CLASS_CTE_PARAMS = tuple(v for item in enumerate(CLASS_NAMES) for v in item)
 
 class CardResolver:
     def __init__(self, db_path: str = "shadowverse_cards.db"):
         self.db_path = db_path
-        self._cache = {}  # 簡易キャッシュ
+        self._local = threading.local()
+        self._name_index = self._load_name_index()
+        # 解決結果をLRUキャッシュ（インスタンス単位、カードデータの版が変わったら作り直す）
+        self._resolve_cached = functools.lru_cache(maxsize=8192)(self._resolve_card_id)
+        self.card_data = card_data_watcher(db_path)
+        self.card_data.register(self.refresh)
+
+    def _conn(self) -> sqlite3.Connection:
+        """スレッドごとのSQLite接続を取得（初回のみ接続）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA cache_size=-20000")
+            self._local.conn = conn
+        return conn
+
+    def _load_name_index(self) -> Dict[str, str]:
+        """完全一致用の名前→card_id辞書を構築（cardsテーブル未作成なら空）"""
+        with self._conn() as conn:
+            try:
+                cursor = conn.execute(
+                    "SELECT name, card_id FROM cards WHERE is_token = 0 ORDER BY rowid"
+                )
+            except sqlite3.OperationalError:
+                return {}
+            index = {}
+            for name, card_id in cursor:
+                index.setdefault(name, card_id)
+            return index
+
+    def refresh(self):
+        """カードデータ更新後に名前辞書とキャッシュを作り直す"""
+        self._name_index = self._load_name_index()
+        self._resolve_cached.cache_clear()
 
     def resolve_card_id(self, name_or_id: str) -> Optional[str]:
+        """カード名またはIDからcard_idを解決（キャッシュ付き）"""
+        self.card_data.check()
+        return self._resolve_cached(name_or_id)
+
+    def _resolve_card_id(self, name_or_id: str) -> Optional[str]:
         """カード名またはIDからcard_idを解決"""
         if not name_or_id:
             return None
         
         query = name_or_id.strip()
         
-        # キャッシュチェック
-        if query in self._cache:
-            return self._cache[query]
-        
         # 数字のみの場合はIDとして扱う
-        if re.match(r'^\d+$', query):
+        if query.isdecimal():
             if self._card_exists(query):
-                self._cache[query] = query
                 return query
             return None
         
-        # 名前で検索（完全一致優先）
-        with sqlite3.connect(self.db_path) as conn:
-            # 完全一致
-            cursor = conn.execute(
-                "SELECT card_id FROM cards WHERE name = ? AND is_token = 0 LIMIT 1",
-                (query,)
-            )
-            result = cursor.fetchone()
-            if result:
-                card_id = result[0]
-                self._cache[query] = card_id
-                return card_id
-            
-            # 部分一致（前方一致優先）
+        # 完全一致（事前構築した辞書で判定）
+        card_id = self._name_index.get(query)
+        if card_id:
+            return card_id
+        
+        # 部分一致（前方一致優先）
+        card_id = self._prefix_match(query)
+        if card_id:
+            return card_id
+        
+        # 曖昧一致（表記揺れ・入力ミス対策）
+        return self._fuzzy_match(query)
+
+    def resolve_card_ids_batch(self, names: List[str]) -> List[Optional[str]]:
+        """複数のカード名/IDをまとめて解決（入力順を保持）"""
+        self.card_data.check()
+        queries = {name.strip() for name in names if name and name.strip()}
+        resolved: Dict[str, Optional[str]] = {}
+        
+        # ID指定はIN句1回で存在確認
+        id_queries = [q for q in queries if q.isdecimal()]
+        existing_ids = self._existing_card_ids(id_queries)
+        for q in id_queries:
+            resolved[q] = q if q in existing_ids else None
+        
+        # 完全一致 → 前方一致の順に解決し、残りはまとめて曖昧一致
+        unresolved = []
+        for q in queries:
+            if q in resolved:
+                continue
+            card_id = self._name_index.get(q) or self._prefix_match(q)
+            if card_id:
+                resolved[q] = card_id
+            else:
+                unresolved.append(q)
+        
+        resolved.update(self._fuzzy_match_batch(unresolved))
+        
+        return [resolved.get(name.strip()) if name else None for name in names]
+
+    def _prefix_match(self, query: str) -> Optional[str]:
+        """前方一致で最も短いカード名を探す"""
+        with self._conn() as conn:
             cursor = conn.execute(
                 "SELECT card_id, name FROM cards WHERE name LIKE ? AND is_token = 0 ORDER BY LENGTH(name), name LIMIT 1",
                 (f"{query}%",)
             )
             result = cursor.fetchone()
-            if result:
-                card_id = result[0]
-                self._cache[query] = card_id
-                return card_id
+            return result[0] if result else None
+
+    def _fuzzy_match(self, query: str) -> Optional[str]:
+        """rapidfuzzで最も近いカード名を探す"""
+        if process is None or not self._name_index:
+            return None
+        
+        match = process.extractOne(
+            query, list(self._name_index), scorer=fuzz.WRatio,
+            score_cutoff=FUZZY_SCORE_CUTOFF
+        )
+        return self._name_index[match[0]] if match else None
+
+    def _fuzzy_match_batch(self, queries: List[str]) -> Dict[str, Optional[str]]:
+        """未解決の名前をまとめて曖昧一致（rapidfuzz.process.cdistで一括計算）"""
+        if not queries or process is None or not self._name_index:
+            return {q: None for q in queries}
         
-        return None
+        choices = list(self._name_index)
+        scores = process.cdist(queries, choices, scorer=fuzz.WRatio,
+                               score_cutoff=FUZZY_SCORE_CUTOFF)
+        best = scores.argmax(axis=1)
+        return {
+            q: self._name_index[choices[best[i]]] if scores[i, best[i]] > 0 else None
+            for i, q in enumerate(queries)
+        }
+
+    def _existing_card_ids(self, card_ids: List[str]) -> set:
+        """存在するカードIDをまとめて取得"""
+        if not card_ids:
+            return set()
+        
+        placeholders = ",".join("?" * len(card_ids))
+        with self._conn() as conn:
+            cursor = conn.execute(
+                f"SELECT card_id FROM cards WHERE card_id IN ({placeholders})",
+                card_ids
+            )
+            return {row[0] for row in cursor}
 
     def _card_exists(self, card_id: str) -> bool:
         """カードIDの存在確認"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._conn() as conn:
             cursor = conn.execute(
                 "SELECT 1 FROM cards WHERE card_id = ? LIMIT 1",
                 (card_id,)
@@ -66,20 +178,23 @@ class CardResolver:
         if len(query) < 2:
             return []
         
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute("""
-                SELECT card_id, name, class_id, cost, rarity, 
-                       CASE WHEN name = ? THEN 0 ELSE 1 END as priority
-                FROM cards 
-                WHERE name LIKE ? AND is_token = 0
-                ORDER BY priority, LENGTH(name), name
+        with self._conn() as conn:
+            cursor = conn.execute(_CLASS_CTE + """
+                SELECT c.card_id, c.name, c.class_id, c.cost, c.rarity,
+                       COALESCE(cls.name, '不明') as class_name,
+                       CASE WHEN c.name = ? THEN 0 ELSE 1 END as priority
+                FROM cards c
+                LEFT JOIN cls ON cls.id = c.class_id
+                WHERE c.name LIKE ? AND c.is_token = 0
+                ORDER BY priority, LENGTH(c.name), c.name
                 LIMIT ?
-            """, (query, f"%{query}%", limit))
+            """, _CLASS_CTE_PARAMS + (query, f"%{query}%", limit))
             
             return [{
                 'card_id': row[0],
                 'name': row[1],
                 'class_id': row[2],
                 'cost': row[3],
-                'rarity': row[4]
+                'rarity': row[4],
+                'class_name': row[5]
             } for row in cursor.fetchall()]
@@ -23,12 +23,16 @@ def check_class_mapping():
         ]
         
         print("\n=== 特定カードでの確認 ===")
-        for card_id, expected_name in test_cards:
-            cursor = conn.execute("""
-                SELECT name, class_id, class_name 
-                FROM cards WHERE card_id = ?
-            """, (card_id,))
-            row = cursor.fetchone()
+        card_ids = [card_id for card_id, _ in test_cards]
+        placeholders = ",".join("?" * len(card_ids))
+        cursor = conn.execute(f"""
+            SELECT card_id, name, class_id, class_name 
+            FROM cards WHERE card_id IN ({placeholders})
+        """, card_ids)
+        rows = {row[0]: row[1:] for row in cursor}
+        
+        for card_id in card_ids:
+            row = rows.get(card_id)
             if row:
                 print(f"{row[0]}: クラスID {row[1]} ({row[2]})")
 
@@ -37,20 +41,24 @@ def fix_class_mapping_if_needed():
     with sqlite3.connect("shadowverse_cards.db") as conn:
         # 修正が必要な場合のみ実行
         corrections = [
-            #("UPDATE cards SET class_name='Blood' WHERE class_id=5", "Blood"),
-            #("UPDATE cards SET class_name='Haven' WHERE class_id=6", "Haven"), 
-            #("UPDATE cards SET class_name='Nemesis' WHERE class_id=7", "Nemesis")
-            ("UPDATE cards SET class_name='Elf' WHERE class_id=1", "Elf"),
-            ("UPDATE cards SET class_name='Royal' WHERE class_id=2", "Royal"),
-            ("UPDATE cards SET class_name='Witch' WHERE class_id=3", "Witch"),
-            ("UPDATE cards SET class_name='Dragon' WHERE class_id=4", "Dragon"),
-            ("UPDATE cards SET class_name='Nightmare' WHERE class_id=5", "Nightmare"),
-            ("UPDATE cards SET class_name='Bishop' WHERE class_id=6", "Bishop"),
-            ("UPDATE cards SET class_name='Nemesis' WHERE class_id=7", "Nemesis")
+            #(5, "Blood"),
+            #(6, "Haven"), 
+            #(7, "Nemesis")
+            (1, "Elf"),
+            (2, "Royal"),
+            (3, "Witch"),
+            (4, "Dragon"),
+            (5, "Nightmare"),
+            (6, "Bishop"),
+            (7, "Nemesis")
         ]
         
-        for sql, class_name in corrections:
-            result = conn.execute(sql)
+        # 名前が異なる行（NULLを含む）だけを更新し、クラスごとに修正枚数を表示
+        for class_id, class_name in corrections:
+            result = conn.execute(
+                "UPDATE cards SET class_name = ? WHERE class_id = ? AND class_name IS NOT ?",
+                (class_name, class_id, class_name)
+            )
             if result.rowcount > 0:
                 print(f"{class_name}クラスのマッピングを修正: {result.rowcount}枚")
         
@@ -8,17 +8,28 @@ DB_PATH = "./shadowverse_cards.db"
 LOG_FILE = "app.log"
 LOG_LEVEL = "INFO"  # DEBUG, INFO, WARNING, ERROR, CRITICAL
 
-# クラス表示名マッピング
-CLASS_NAMES = {
-    0: "ニュートラル", 1: "エルフ", 2: "ロイヤル", 3: "ウィッチ",
-    4: "ドラゴン", 5: "ナイトメア", 6: "ビショップ", 7: "ネメシス"
+# クラス表示名（クラスIDで直接引く）
+CLASS_NAMES = (
+    "ニュートラル", "エルフ", "ロイヤル", "ウィッチ",
+    "ドラゴン", "ナイトメア", "ビショップ", "ネメシス"
+)
+
+# 役割→ビット（cards.roles_maskの定義。ビルダーのrole_patternsと同じ並び）
+ROLE_BITS = {
+    "removal": 1, "draw": 2, "heal": 4, "aoe": 8, "finisher": 16, "protection": 32
 }
 
 # アプリケーション設定
+# 開発サーバーはシングルスレッド・自動リロードで遅くなるため既定はdebug無効
+# 本番環境: gunicorn -w 4 -k gthread --threads 8 app:app
+#   （--preloadは使わない: ログ書き込み等のスレッドはワーカーごとに起動する）
+#   カード情報のキャッシュは各ワーカーがDBの版を数秒おきに確認して無効化するため、
+#   CLIや他ワーカーでの再構築もCARD_DATA_CHECK_INTERVAL秒以内に反映される
 APP_CONFIG = {
     'host': '0.0.0.0',
     'port': 5000,
-    'debug': True
+    'debug': os.environ.get('SV2PICK_DEBUG') == '1',
+    'threaded': True
 }
 
 # キャッシュ設定
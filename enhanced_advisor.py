@@ -1,15 +1,45 @@
 # enhanced_advisor.py
-from pick_advisor import TwoPickAdvisor, PickAdvice
+from pick_advisor import TwoPickAdvisor, PickAdvice, DeckState
 from card_resolver import CardResolver
 from synergy_engine import SynergyEngine
 from archetype_analyzer import ArchetypeAnalyzer
-import sqlite3
-import json
-from typing import Dict, List, Any, Optional
+import re
+import functools
+import numpy as np
+from collections import Counter
+from typing import Dict, List, Any, Optional, Tuple
 from meta_adjustments import get_meta_adjustments, get_meta_info
 from weights_manager import WeightsManager
 import config
 
+__all__ = ['EnhancedTwoPickAdvisor', 'PickAdvice', 'parse_deck_names']
+
+# スコア要素の並び（重みベクトルと同じ順序）
+SCORE_FEATURES = ('base', 'curve', 'role', 'duplication', 'synergy', 'archetype', 'meta')
+
+# 候補の評価要素と最終スコアをまとめて持つレコード型（全フィールドfloat64）
+SCORE_DTYPE = np.dtype([(f, np.float64) for f in SCORE_FEATURES] + [('final', np.float64)])
+
+# クラスID→英語クラス名（cards.class_nameと同じ表記）
+_CLASS_NAMES = ("Neutral", "Elf", "Royal", "Witch", "Dragon", "Nightmare", "Bishop", "Nemesis")
+
+# コスト別枚数配列の最小長（0〜10コスト）
+CURVE_ARRAY_SIZE = 11
+
+# デッキ入力の区切り（半角カンマ・読点）
+_DECK_SEP = re.compile(r'[,、]+')
+
+def parse_deck_names(deck_input: str) -> List[str]:
+    """カンマ・読点区切りのデッキ入力をカード名のリストに分割"""
+    return [name for name in (s.strip() for s in _DECK_SEP.split(deck_input)) if name]
+
+def curve_array(curve: Dict[int, int]) -> np.ndarray:
+    """コスト→枚数の辞書をコストで添字付けしたint32配列に変換"""
+    arr = np.zeros(max(CURVE_ARRAY_SIZE, max(curve, default=0) + 1), dtype=np.int32)
+    if curve:
+        arr[list(curve.keys())] = list(curve.values())
+    return arr
+
 class EnhancedTwoPickAdvisor(TwoPickAdvisor):
     def __init__(self, db_path: str = config.DB_PATH):
         super().__init__(db_path)
@@ -17,44 +47,63 @@ class EnhancedTwoPickAdvisor(TwoPickAdvisor):
         self.synergy_engine = SynergyEngine(db_path)
         self.archetype_analyzer = ArchetypeAnalyzer(db_path)
         self.weights_manager = WeightsManager()  # 追加
+        self._weights_version = -1
+        self._weights_vec = None
         
         # メタ調整情報を読み込み
-        from meta_adjustments import get_meta_adjustments, get_meta_info
         self.meta_adjustments = get_meta_adjustments()
         self.meta_info = get_meta_info()
+        
+        # 調整テーブルを種類別に展開しておく
+        self._meta_card = self.meta_adjustments.get('card_id', {})
+        self._meta_archetype = self.meta_adjustments.get('archetype', {})
+        self._meta_class = self.meta_adjustments.get('class_name', {})
+        # メタ表は起動後不変なので、引数の組ごとに結果をLRUキャッシュ（インスタンス単位）
+        self._meta_bonus = functools.lru_cache(maxsize=2048)(self._meta_bonus_uncached)
 
     
     def _calculate_meta_bonus(self, card: Dict[str, Any], 
                             detected_archetype: Optional[str], 
                             deck_class_name: str) -> float:
         """メタ調整ボーナスを計算"""
-        bonus = 0.0
-        
+        return self._meta_bonus(card['card_id'], card['class_name'], detected_archetype, deck_class_name)
+    
+    def _meta_bonus_uncached(self, card_id: str, card_class_name: str,
+                             detected_archetype: Optional[str], deck_class_name: str) -> float:
+        """メタ調整ボーナスを計算（キャッシュなし）"""
         # カードID直接調整
-        if card['card_id'] in self.meta_adjustments.get('card_id', {}):
-            bonus += self.meta_adjustments['card_id'][card['card_id']]
+        bonus = self._meta_card.get(card_id, 0.0)
         
         # アーキタイプ調整
-        if detected_archetype and detected_archetype in self.meta_adjustments.get('archetype', {}):
-            bonus += self.meta_adjustments['archetype'][detected_archetype]
+        if detected_archetype:
+            bonus += self._meta_archetype.get(detected_archetype, 0.0)
         
         # クラス調整（候補カードのクラスがデッキの主要クラスと一致する場合）
-        card_class_name = card['class_name']
-        if card_class_name == deck_class_name and card_class_name in self.meta_adjustments.get('class_name', {}):
-            bonus += self.meta_adjustments['class_name'][card_class_name]
-        elif card_class_name == 'Neutral' and deck_class_name in self.meta_adjustments.get('class_name', {}):
+        if card_class_name == deck_class_name and card_class_name in self._meta_class:
+            bonus += self._meta_class[card_class_name]
+        elif card_class_name == 'Neutral' and deck_class_name in self._meta_class:
             # ニュートラルカードはデッキクラスの半分の調整を受ける
-            bonus += self.meta_adjustments['class_name'][deck_class_name] * 0.5
+            bonus += self._meta_class[deck_class_name] * 0.5
         
-        return round(bonus, 1)
+        return bonus
+    
+    def _weight_vector(self) -> np.ndarray:
+        """SCORE_FEATURES順の重みベクトル（重み更新時のみ作り直す）"""
+        if self._weights_version != self.weights_manager.version:
+            weights = self.weights_manager.get_weights()
+            self._weights_vec = np.array([weights.get(f, 1.0) for f in SCORE_FEATURES], dtype=np.float64)
+            self._weights_version = self.weights_manager.version
+        return self._weights_vec
         
     def get_pick_advice_by_names(self, candidate1: str, candidate2: str, 
                                 deck_input: str, pick_index: int, 
                                 rerolls_left: int) -> Dict[str, Any]:
         """名前またはIDでアドバイスを取得（シナジー・アーキタイプ対応）"""
-        # カードIDに解決
-        card1_id = self.resolver.resolve_card_id(candidate1)
-        card2_id = self.resolver.resolve_card_id(candidate2)
+        deck_names = parse_deck_names(deck_input)
+        
+        # 候補2枚とデッキをまとめてカードIDに解決
+        resolved_ids = self.resolver.resolve_card_ids_batch([candidate1, candidate2, *deck_names])
+        card1_id, card2_id = resolved_ids[0], resolved_ids[1]
         
         if not card1_id or not card2_id:
             return {
@@ -65,14 +114,7 @@ class EnhancedTwoPickAdvisor(TwoPickAdvisor):
                 }
             }
         
-        # デッキIDリストを解決
-        deck_ids = []
-        if deck_input.strip():
-            deck_names = [name.strip() for name in deck_input.replace('、', ',').split(',') if name.strip()]
-            for name in deck_names:
-                card_id = self.resolver.resolve_card_id(name)
-                if card_id:
-                    deck_ids.append(card_id)
+        deck_ids = [card_id for card_id in resolved_ids[2:] if card_id]
         
         # 拡張アドバイス取得
         advice = self.get_pick_advice_enhanced(
@@ -85,89 +127,62 @@ class EnhancedTwoPickAdvisor(TwoPickAdvisor):
         return {
             'advice': advice,
             'resolved_deck_count': len(deck_ids),
-            'original_deck_count': len(deck_names) if deck_input.strip() else 0
+            'original_deck_count': len(deck_names)
         }
 
     def get_pick_advice_enhanced(self, candidate_card_ids: List[str], 
                                current_deck_ids: List[str], pick_index: int, 
-                               rerolls_left: int) -> PickAdvice:
-        """メタ調整を含む拡張アドバイス"""
-        deck_analysis = self.analyze_deck(current_deck_ids)
-        
-        # デッキの主要クラスとアーキタイプを事前取得
+                               rerolls_left: int,
+                               deck_state: Optional[DeckState] = None) -> PickAdvice:
+        """メタ調整を含む拡張アドバイス（deck_stateを渡すとデッキの再集計を省略）"""
+        # 候補とデッキのカード情報を1回のクエリで先読み
+        self.get_cards_bulk([*candidate_card_ids, *current_deck_ids])
+        if deck_state is None:
+            deck_state = self.build_state(current_deck_ids)
+        deck_analysis = deck_state.as_analysis()
+        
+        # デッキ全体の分析は1回だけ行い、各候補のボーナス計算で使い回す
         synergy_analysis = self.synergy_engine.analyze_deck_synergies(current_deck_ids)
         archetype_analysis = self.archetype_analyzer.analyze_deck_archetype(current_deck_ids)
         
         # 主要クラス名を取得
         main_class_id = synergy_analysis.get("main_class", 0)
-        class_mapping = {0: "Neutral", 1: "Elf", 2: "Royal", 3: "Witch", 4: "Dragon", 5: "Nightmare", 6: "Bishop", 7: "Nemesis"}
-        deck_class_name = class_mapping.get(main_class_id, "Neutral")
+        deck_class_name = _CLASS_NAMES[main_class_id] if 0 <= main_class_id < len(_CLASS_NAMES) else "Neutral"
         detected_archetype = archetype_analysis.get("detected_archetype")
         
-        card_scores = []
-        weights = self.weights_manager.get_weights() 
+        # 候補ごとの評価で共有するデッキ側の情報
+        ctx = {
+            "deck_analysis": deck_analysis,
+            "curve_tables": self.curve_tables(deck_analysis),
+            "current_deck_ids": current_deck_ids,
+            "pick_index": pick_index,
+            "synergy_analysis": synergy_analysis,
+            "archetype_analysis": archetype_analysis,
+            "detected_archetype": detected_archetype,
+            "deck_class_name": deck_class_name,
+            "deck_counter": deck_state.card_counts,
+        }
         
         # 各候補カードを評価
-        for card_id in candidate_card_ids:
-            card = self.get_card_info(card_id)
-            if not card:
-                continue
-            
-            # 基本評価
-            base_score = card.get("base_rating", 50.0)
-            curve_bonus = self.calculate_curve_bonus(card["cost"], deck_analysis, pick_index)
-            role_bonus = self.calculate_role_bonus(card["roles"], deck_analysis)
-            
-            # 重複ペナルティ
-            duplication_penalty = 0
-            if card_id in current_deck_ids:
-                count = current_deck_ids.count(card_id)
-                duplication_penalty = -5 * count
-            
-            # シナジーボーナス
-            synergy_bonus, synergy_reasons = self.synergy_engine.calculate_synergy_bonus(
-                card_id, current_deck_ids, pick_index
-            )
-            
-            # アーキタイプボーナス
-            archetype_bonus, archetype_reasons = self.archetype_analyzer.calculate_archetype_bonus(
-                card_id, current_deck_ids
-            )
-            
-            # メタボーナス（新規追加）
-            meta_bonus = self._calculate_meta_bonus(card, detected_archetype, deck_class_name)
-            
-            final_score = (
-                weights.get("base", 1.0) * base_score +
-                weights.get("curve", 1.0) * curve_bonus +
-                weights.get("role", 1.0) * role_bonus +
-                weights.get("duplication", 1.0) * duplication_penalty +
-                weights.get("synergy", 1.0) * synergy_bonus +
-                weights.get("archetype", 1.0) * archetype_bonus +
-                weights.get("meta", 1.0) * meta_bonus
-            )
-            
-            card_scores.append({
-                "card_id": card_id,
-                "name": card["name"],
-                "cost": card["cost"],
-                "base_score": base_score,
-                "curve_bonus": curve_bonus,
-                "role_bonus": role_bonus,
-                "duplication_penalty": duplication_penalty,
-                "synergy_bonus": synergy_bonus,
-                "archetype_bonus": archetype_bonus,
-                "meta_bonus": meta_bonus,  # 新規追加
-                "final_score": final_score,
-                "synergy_reasons": synergy_reasons,
-                "archetype_reasons": archetype_reasons
-            })
-        
-        if not card_scores:
+        scored = [s for s in (self._score_candidate(card_id, ctx) for card_id in candidate_card_ids) if s]
+        if not scored:
             return PickAdvice("pick", None, None, 0, ["評価可能なカードがありません"], [])
         
-        # 最高スコアのカードを特定
-        best_card = max(card_scores, key=lambda x: x["final_score"])
+        # 評価要素は候補×フィールドの連続した配列に詰める
+        scores_arr = np.zeros(len(scored), dtype=SCORE_DTYPE)
+        for i, (features, _) in enumerate(scored):
+            scores_arr[i] = (*features, 0.0)
+        card_scores = [score for _, score in scored]
+        
+        # (候補数, 要素数) × 重みベクトルで最終スコアを一括計算
+        table = scores_arr.view(np.float64).reshape(len(scored), len(SCORE_DTYPE))
+        scores_arr['final'] = table[:, :len(SCORE_FEATURES)] @ self._weight_vector()
+        final_scores = scores_arr['final'].tolist()
+        for score, final_score in zip(card_scores, final_scores):
+            score["final_score"] = final_score
+        
+        # 最高スコアのカードを特定（同点は先の候補）
+        best_card = card_scores[int(scores_arr['final'].argmax())]
         best_score = best_card["final_score"]
         
         # リロール判断
@@ -209,44 +224,94 @@ class EnhancedTwoPickAdvisor(TwoPickAdvisor):
             card_scores=card_scores
         )
 
+    def _score_candidate(self, card_id: str, ctx: Dict[str, Any]) -> Optional[Tuple[Tuple[float, ...], Dict[str, Any]]]:
+        """候補1枚の評価要素（SCORE_FEATURES順）とスコア詳細を返す"""
+        card = self.get_card_info(card_id)
+        if not card:
+            return None
+        
+        deck_analysis = ctx["deck_analysis"]
+        current_deck_ids = ctx["current_deck_ids"]
+        pick_index = ctx["pick_index"]
+        
+        # 基本評価
+        base_score = card.get("base_rating", 50.0)
+        curve_bonus = self.calculate_curve_bonus(card["cost"], ctx["curve_tables"], pick_index)
+        role_bonus = self.calculate_role_bonus(card["roles_mask"], deck_analysis)
+        
+        # 重複ペナルティ
+        count = ctx["deck_counter"].get(card_id, 0)
+        duplication_penalty = -5 * count if count else 0
+        
+        # シナジーボーナス
+        synergy_bonus, synergy_reasons = self.synergy_engine.calculate_synergy_bonus(
+            card_id, current_deck_ids, pick_index, deck_synergies=ctx["synergy_analysis"]
+        )
+        
+        # アーキタイプボーナス
+        archetype_bonus, archetype_reasons = self.archetype_analyzer.calculate_archetype_bonus(
+            card_id, current_deck_ids, archetype_analysis=ctx["archetype_analysis"]
+        )
+        
+        # メタボーナス（新規追加）
+        meta_bonus = self._calculate_meta_bonus(card, ctx["detected_archetype"], ctx["deck_class_name"])
+        
+        # 重み付き合計は呼び出し側で全候補まとめて行列積で計算する
+        features = (
+            base_score, curve_bonus, role_bonus, duplication_penalty,
+            synergy_bonus, archetype_bonus, meta_bonus
+        )
+        
+        return features, {
+            "card_id": card_id,
+            "name": card["name"],
+            "cost": card["cost"],
+            "base_score": base_score,
+            "curve_bonus": curve_bonus,
+            "role_bonus": role_bonus,
+            "duplication_penalty": duplication_penalty,
+            "synergy_bonus": synergy_bonus,
+            "archetype_bonus": archetype_bonus,
+            "meta_bonus": meta_bonus,  # 新規追加
+            "final_score": 0.0,
+            "synergy_reasons": synergy_reasons,
+            "archetype_reasons": archetype_reasons
+        }
+
     def get_deck_analysis_detailed(self, deck_input: str) -> Dict[str, Any]:
         """詳細なデッキ分析（シナジー・アーキタイプ対応）"""
         deck_ids = []
         unresolved = []
         
-        if deck_input.strip():
-            deck_names = [name.strip() for name in deck_input.replace('、', ',').split(',') if name.strip()]
-            for name in deck_names:
-                card_id = self.resolver.resolve_card_id(name)
+        deck_names = parse_deck_names(deck_input)
+        if deck_names:
+            for name, card_id in zip(deck_names, self.resolver.resolve_card_ids_batch(deck_names)):
                 if card_id:
                     deck_ids.append(card_id)
                 else:
                     unresolved.append(name)
         
+        self.get_cards_bulk(deck_ids)
         basic_analysis = self.analyze_deck(deck_ids)
         
         # 追加分析
         card_details = []
         total_rating = 0
-        class_distribution = {}
-        type_distribution = {}
         
         for card_id in deck_ids:
             card = self.get_card_info(card_id)
             if card:
                 card_details.append(card)
                 total_rating += card.get('base_rating', 50)
-                
-                class_name = card['class_name']
-                class_distribution[class_name] = class_distribution.get(class_name, 0) + 1
-                
-                card_type = card['card_type']
-                type_distribution[card_type] = type_distribution.get(card_type, 0) + 1
+        
+        class_distribution = Counter(card['class_name'] for card in card_details)
+        type_distribution = Counter(card['card_type'] for card in card_details)
         
         # 評価とアドバイス
         avg_rating = total_rating / len(card_details) if card_details else 50
-        strength_assessment = self._assess_deck_strength(avg_rating, basic_analysis)
-        recommendations = self._generate_recommendations(basic_analysis, card_details)
+        curve_arr = curve_array(basic_analysis['curve'])
+        strength_assessment = self._assess_deck_strength(avg_rating, curve_arr)
+        recommendations = self._generate_recommendations(basic_analysis, card_details, curve_arr)
         
         # シナジー分析
         synergy_analysis = self.synergy_engine.analyze_deck_synergies(deck_ids)
@@ -267,10 +332,9 @@ class EnhancedTwoPickAdvisor(TwoPickAdvisor):
             'archetype_analysis': archetype_analysis
         }
 
-    def _assess_deck_strength(self, avg_rating: float, analysis: Dict) -> Dict[str, Any]:
+    def _assess_deck_strength(self, avg_rating: float, curve_arr: np.ndarray) -> Dict[str, Any]:
         """デッキ強度を評価"""
-        curve = analysis['curve']
-        early_game = sum(curve.get(i, 0) for i in [1, 2, 3])
+        early_game = int(curve_arr[1:4].sum())
         
         # カーブペナルティ
         curve_penalty = max(0, 8 - early_game) * 2
@@ -299,18 +363,18 @@ class EnhancedTwoPickAdvisor(TwoPickAdvisor):
             'curve_penalty': curve_penalty
         }
 
-    def _generate_recommendations(self, analysis: Dict, cards: List[Dict]) -> List[str]:
+    def _generate_recommendations(self, analysis: Dict, cards: List[Dict],
+                                  curve_arr: np.ndarray) -> List[str]:
         """改善提案を生成"""
         recommendations = []
-        curve = analysis['curve']
         roles = analysis['roles']
         
         # カーブ分析
-        early_cards = sum(curve.get(i, 0) for i in [1, 2, 3])
+        early_cards = int(curve_arr[1:4].sum())
         if early_cards < 8:
             recommendations.append(f"序盤カード（1-3コスト）を増やしましょう（現在{early_cards}枚）")
         
-        heavy_cards = sum(curve.get(i, 0) for i in [6, 7, 8, 9, 10])
+        heavy_cards = int(curve_arr[6:11].sum())
         if heavy_cards > 4:
             recommendations.append(f"重いカード（6コスト以上）を減らしましょう（現在{heavy_cards}枚）")
         
@@ -322,7 +386,7 @@ class EnhancedTwoPickAdvisor(TwoPickAdvisor):
             recommendations.append("フィニッシャーとなるカードを追加しましょう")
         
         # 戦略提案
-        avg_cost = sum(cost * count for cost, count in curve.items()) / max(1, sum(curve.values()))
+        avg_cost = float(np.arange(len(curve_arr)) @ curve_arr) / max(1, int(curve_arr.sum()))
         if avg_cost < 3.5:
             recommendations.append("アグロ戦略: 序盤から積極的に攻めましょう")
         elif avg_cost > 4.5:
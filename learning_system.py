@@ -6,6 +6,56 @@ from typing import Dict, List, Any, Optional
 from weights_manager import WeightsManager
 from config import DB_PATH
 
+try:
+    from numba import njit
+except ImportError:  # numba未導入環境ではNumPyで組み立てる
+    njit = None
+
+try:
+    import orjson
+except ImportError:  # orjson未導入環境では標準jsonを使用
+    orjson = None
+
+NUMBA_AVAILABLE = njit is not None
+
+_json_loads = orjson.loads if orjson else json.loads
+
+# 学習特徴量名 → ログ(scores_json)上のフィールド名
+# meta_bonusは導入前の古いログに無いため必須フィールドから外す
+FEATURE_FIELDS = (
+    ('base', 'base_score'),
+    ('curve', 'curve_bonus'),
+    ('role', 'role_bonus'),
+    ('duplication', 'duplication_penalty'),
+    ('synergy', 'synergy_bonus'),
+    ('archetype', 'archetype_bonus'),
+)
+FEATURE_NAMES = tuple(name for name, _ in FEATURE_FIELDS) + ('meta',)
+
+def _score_values(score: Dict[str, Any]) -> tuple:
+    """スコア辞書から特徴量をFEATURE_NAMES順のタプルで取り出す"""
+    return tuple(score[field] for _, field in FEATURE_FIELDS) + (score.get('meta_bonus', 0),)
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _assemble_feature_matrix(base, curve, role, duplication, synergy, archetype, meta):
+        """7つの特徴量列を(N, 7)の連続配列に詰める"""
+        n = base.shape[0]
+        X = np.empty((n, 7))
+        for i in range(n):
+            X[i, 0] = base[i]
+            X[i, 1] = curve[i]
+            X[i, 2] = role[i]
+            X[i, 3] = duplication[i]
+            X[i, 4] = synergy[i]
+            X[i, 5] = archetype[i]
+            X[i, 6] = meta[i]
+        return X
+else:
+    def _assemble_feature_matrix(*columns):
+        """7つの特徴量列を(N, 7)の配列に詰める"""
+        return np.column_stack(columns)
+
 class LearningSystem:
     def __init__(self):
         self.db_path = DB_PATH
@@ -16,32 +66,30 @@ class LearningSystem:
         training_data = []
         
         with sqlite3.connect(self.db_path) as conn:
+            # 学習時のみの一括走査なのでページキャッシュを大きめに取る
+            conn.execute("PRAGMA cache_size = -65536")
             cursor = conn.execute("""
                 SELECT chosen_id, scores_json, recommended_id
                 FROM pick_logs 
                 WHERE action = 'pick' AND chosen_id IS NOT NULL AND scores_json IS NOT NULL
             """)
             
-            for chosen_id, scores_json, recommended_id in cursor.fetchall():
+            # 全件をfetchallせず、カーソルから1行ずつ読み出す
+            for chosen_id, scores_json, recommended_id in cursor:
                 try:
-                    scores = json.loads(scores_json)
+                    scores = _json_loads(scores_json)
                     if len(scores) >= 2:
                         # ユーザーが選んだカードと推奨カードの特徴差分を計算
                         chosen_score = next((s for s in scores if s['card_id'] == chosen_id), None)
                         other_scores = [s for s in scores if s['card_id'] != chosen_id]
                         
                         if chosen_score and other_scores:
+                            chosen_values = _score_values(chosen_score)
                             for other_score in other_scores:
                                 # 特徴差分を計算（chosen - other）
-                                feature_diff = {
-                                    'base': chosen_score.get('base_score', 0) - other_score.get('base_score', 0),
-                                    'curve': chosen_score.get('curve_bonus', 0) - other_score.get('curve_bonus', 0),
-                                    'role': chosen_score.get('role_bonus', 0) - other_score.get('role_bonus', 0),
-                                    'duplication': chosen_score.get('duplication_penalty', 0) - other_score.get('duplication_penalty', 0),
-                                    'synergy': chosen_score.get('synergy_bonus', 0) - other_score.get('synergy_bonus', 0),
-                                    'archetype': chosen_score.get('archetype_bonus', 0) - other_score.get('archetype_bonus', 0),
-                                    'meta': chosen_score.get('meta_bonus', 0) - other_score.get('meta_bonus', 0)
-                                }
+                                feature_diff = dict(zip(FEATURE_NAMES, (
+                                    c - o for c, o in zip(chosen_values, _score_values(other_score))
+                                )))
                                 
                                 training_data.append({
                                     'features': feature_diff,
@@ -60,8 +108,13 @@ class LearningSystem:
             return self.weights_manager.get_weights()
         
         # 特徴マトリックスとラベルを準備
-        features = ['base', 'curve', 'role', 'duplication', 'synergy', 'archetype', 'meta']
-        X = np.array([[sample['features'][f] for f in features] for sample in training_data])
+        features = FEATURE_NAMES
+        n = len(training_data)
+        columns = [
+            np.fromiter((sample['features'][f] for sample in training_data), dtype=np.float64, count=n)
+            for f in features
+        ]
+        X = _assemble_feature_matrix(*columns)
         y = np.array([sample['label'] for sample in training_data])
         
         if len(X) < 5:  # 最小データ数
@@ -69,13 +122,14 @@ class LearningSystem:
         
         # 簡易線形回帰（正則化付き）
         try:
-            # L2正則化項を追加
+            # L2正則化は [X; √λI] w = [y; 0] の最小二乗として解く
+            # （正規方程式 XᵀX を作らないため条件数が二乗されない）
             lambda_reg = 0.01
-            XtX = X.T @ X + lambda_reg * np.eye(len(features))
-            Xty = X.T @ y
+            X_aug = np.vstack([X, np.sqrt(lambda_reg) * np.eye(len(features))])
+            y_aug = np.concatenate([y, np.zeros(len(features))])
             
             # 重み計算
-            optimal_weights = np.linalg.solve(XtX, Xty)
+            optimal_weights = np.linalg.lstsq(X_aug, y_aug, rcond=None)[0]
             
             # 重みを正規化（極端な値を避ける）
             optimal_weights = np.clip(optimal_weights, 0.1, 3.0)
@@ -110,7 +164,10 @@ class LearningSystem:
         self.weights_manager.update_weights(new_weights)
         
         # 統計情報
-        agreement_rate = sum(1 for d in training_data if d['agreement']) / len(training_data)
+        agreement_flags = np.fromiter(
+            (d['agreement'] for d in training_data), dtype=np.bool_, count=len(training_data)
+        )
+        agreement_rate = float(agreement_flags.mean())
         
         return {
             'success': True,
@@ -1,9 +1,162 @@
 # pick_advisor.py
+import os
+import pickle
 import sqlite3
 import json
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass
-from cache_system import card_info_cache, cached_method
+import tempfile
+import threading
+import time
+import numpy as np
+from typing import List, Dict, Any, Iterable, NamedTuple, Optional, Tuple
+from typing import Sequence as SequenceType
+from collections import Counter
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from config import ROLE_BITS
+from cache_system import (CARD_FINGERPRINT_SQL, card_data_watcher, card_info_cache,
+                          cached_method, method_cache_key)
+
+try:
+    import orjson
+except ImportError:  # orjson未導入環境では標準jsonを使用
+    orjson = None
+
+try:
+    from numba import njit
+except ImportError:  # numba未導入環境では同じ処理をPythonで実行
+    njit = None
+
+NUMBA_AVAILABLE = njit is not None
+
+_json_loads = orjson.loads if orjson else json.loads
+
+# カード情報（メトリクス付き）の取得
+CARD_INFO_SELECT = """
+    SELECT c.*, m.base_rating AS metric_base_rating, m.stat_efficiency, m.role_score,
+           m.keyword_score, m.rarity_bonus, m.impact_score
+    FROM cards c
+    LEFT JOIN card_metrics m ON c.card_id = m.card_id
+"""
+CARD_INFO_SQL = CARD_INFO_SELECT + "WHERE c.card_id = ?"
+
+# カーブ表で添字アクセスするコストの範囲（0〜10）
+CURVE_TABLE_SIZE = 11
+
+# 一括取得1回あたりのID数（SQLiteのバインド変数上限より十分小さく）
+BULK_FETCH_CHUNK = 500
+
+# 解析済みカード情報のスナップショット（DBと同じディレクトリに置く）
+CARD_SNAPSHOT_FILE = "cards.pkl"
+
+def _card_info_key(card_id: str):
+    """get_card_infoのキャッシュキー"""
+    return method_cache_key("card_info", "_cached_card_info", (card_id,))
+
+def _row_to_card(row: sqlite3.Row) -> Dict[str, Any]:
+    """取得行をカード情報の辞書に変換"""
+    card = dict(row)
+    # 評価値はメトリクス側を優先する（列の位置はcards側のまま）
+    card["base_rating"] = card.pop("metric_base_rating")
+    
+    # JSON文字列を変換（キャッシュで共有するため変更不可のタプルにする）
+    card["roles"] = tuple(_json_loads(card["roles"] or "[]"))
+    card["keywords"] = tuple(_json_loads(card["keywords"] or "[]"))
+    
+    # 役割判定はビット演算で行う（roles_mask列のない旧DBでは読み込み時に求める）
+    if card.get("roles_mask") is None:
+        roles_mask = 0
+        for role in card["roles"]:
+            roles_mask |= ROLE_BITS.get(role, 0)
+        card["roles_mask"] = roles_mask
+    
+    return card
+
+def _curve_bonus(current_count, adjusted_target, card_cost, pick_index):
+    """マナカーブ補正（calculate_curve_bonusと一括計算の共通処理）"""
+    if current_count < adjusted_target:
+        bonus = min((adjusted_target - current_count) * 8, 15)
+        # 序盤は低コスト重視
+        if pick_index <= 8 and card_cost <= 3:
+            bonus *= 1.3
+        return bonus
+    if current_count > adjusted_target * 1.5:
+        return -min((current_count - adjusted_target) * 5, 10)
+    return 0.0
+
+def _role_bonus(current_count, target_count):
+    """役割1つ分の補正（calculate_role_bonusと一括計算の共通処理）"""
+    if current_count < target_count:
+        return min((target_count - current_count) * 6, 12)
+    if current_count >= target_count * 1.5:
+        return -5
+    return 0.0
+
+if NUMBA_AVAILABLE:
+    _curve_bonus_kernel = njit(cache=True)(_curve_bonus)
+    _role_bonus_kernel = njit(cache=True)(_role_bonus)
+else:
+    _curve_bonus_kernel = _curve_bonus
+    _role_bonus_kernel = _role_bonus
+
+def _score_batch(curve_current, curve_targets, costs, roles_masks,
+                 role_bits, role_current, role_targets, pick_index):
+    """候補ごとのカーブ補正・役割補正を配列でまとめて計算"""
+    n = costs.shape[0]
+    curve_bonus = np.zeros(n)
+    role_bonus = np.zeros(n)
+    for i in range(n):
+        curve_bonus[i] = _curve_bonus_kernel(curve_current[i], curve_targets[i], costs[i], pick_index)
+        for r in range(role_bits.shape[0]):
+            if roles_masks[i] & role_bits[r]:
+                role_bonus[i] += _role_bonus_kernel(role_current[r], role_targets[r])
+    return curve_bonus, role_bonus
+
+if NUMBA_AVAILABLE:
+    _score_batch = njit(cache=True)(_score_batch)
+
+def warm_score_kernel():
+    """一括計算をコンパイル済みにしておく（numbaなしでは何もしない）"""
+    if NUMBA_AVAILABLE:
+        _score_batch(np.zeros(1), np.zeros(1), np.zeros(1, dtype=np.int64),
+                     np.zeros(1, dtype=np.int64), np.ones(1, dtype=np.int64),
+                     np.zeros(1), np.ones(1), 1)
+
+def card_snapshot_path(db_path: str) -> str:
+    """DBに対応するスナップショットのパス"""
+    return os.path.join(os.path.dirname(db_path), CARD_SNAPSHOT_FILE)
+
+def write_card_snapshot(db_path: str) -> int:
+    """全カードの解析済み情報をスナップショットに書き出す（カードデータを構築した側が呼ぶ）
+    
+    メトリクス未構築などで版が取れないDBでは書き出さず0を返す。
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.row_factory = sqlite3.Row
+        try:
+            fingerprint = tuple(conn.execute(CARD_FINGERPRINT_SQL).fetchone())
+        except sqlite3.OperationalError:
+            return 0
+        cards = {}
+        for row in conn.execute(CARD_INFO_SELECT):
+            card = _row_to_card(row)
+            cards[card["card_id"]] = card
+    finally:
+        conn.close()
+    
+    # 読み込み中のプロセスがあっても壊れないよう、一時ファイルに書いてから置き換える
+    snapshot_path = card_snapshot_path(db_path)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(snapshot_path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump({"fingerprint": fingerprint, "cards": cards}, f, protocol=5)
+        # mkstempは0600で作るため、通常のファイルと同じ権限にしておく
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, snapshot_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(cards)
 
 @dataclass
 class PickAdvice:
@@ -13,116 +166,293 @@ class PickAdvice:
     recommended_card_name: Optional[str]
     confidence: float
     reasoning: List[str]
-    card_scores: List[Dict[str, Any]]
+    card_scores: SequenceType[Dict[str, Any]]
+
+class CardScoresView(Sequence):
+    """候補ごとのスコア配列をまとめて保持し、要素を参照したときだけ辞書を作るcard_scores"""
+    __slots__ = ("_cards", "_curve_bonus", "_role_bonus", "_dup_penalties", "_final_scores")
+
+    def __init__(self, cards: List[Dict[str, Any]], curve_bonus: np.ndarray, role_bonus: np.ndarray,
+                 dup_penalties: np.ndarray, final_scores: np.ndarray):
+        self._cards = cards
+        self._curve_bonus = curve_bonus
+        self._role_bonus = role_bonus
+        self._dup_penalties = dup_penalties
+        self._final_scores = final_scores
+
+    def __len__(self) -> int:
+        return len(self._cards)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        card = self._cards[index]
+        return {
+            "card_id": card["card_id"],
+            "name": card["name"],
+            "cost": card["cost"],
+            "base_score": card.get("base_rating", 50.0),
+            "curve_bonus": self._curve_bonus[index].item(),
+            "role_bonus": self._role_bonus[index].item(),
+            "duplication_penalty": self._dup_penalties[index].item(),
+            "final_score": self._final_scores[index].item()
+        }
+
+    def __eq__(self, other):
+        if isinstance(other, (Sequence, list)) and not isinstance(other, str):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"CardScoresView({list(self)!r})"
+
+class CurveTables(NamedTuple):
+    """コスト別の現在枚数と進行度調整済みの目標枚数（リクエストごとに1回作る）"""
+    current: Tuple[int, ...]
+    targets: Tuple[float, ...]
+    progress: float
+
+@dataclass
+class DeckState:
+    """ピックごとに1枚ずつ積み上げるデッキ集計（analyze_deckの逐次版）"""
+    curve: Counter = field(default_factory=Counter)
+    roles: Counter = field(default_factory=Counter)
+    card_counts: Counter = field(default_factory=Counter)  # card_id→枚数（重複ペナルティ用）
+    total: int = 0
+
+    def as_analysis(self) -> Dict[str, Any]:
+        """analyze_deckと同じ形式の辞書に変換"""
+        return {
+            "total_cards": self.total,
+            "curve": self.curve,
+            "roles": self.roles
+        }
 
 class TwoPickAdvisor:
     def __init__(self, db_path: str = "shadowverse_cards.db"):
         self.db_path = db_path
+        self._conn_local = threading.local()
         
         # 理想的なマナカーブ（30枚デッキ）
         self.ideal_curve = {1: 4, 2: 6, 3: 6, 4: 5, 5: 4, 6: 2, 7: 1, 8: 1}
+        self._ideal_curve_table = tuple(self.ideal_curve.get(c, 1) for c in range(CURVE_TABLE_SIZE))
         
         # 役割の目標枚数
         self.role_targets = {
             "removal": 4, "draw": 3, "finisher": 2, "protection": 3, "aoe": 2
         }
+        # ビット→(役割名, 目標枚数)
+        self._role_targets_by_bit = {
+            ROLE_BITS[role]: (role, target) for role, target in self.role_targets.items()
+        }
+        self._role_target_mask = sum(self._role_targets_by_bit)
+        # 一括計算に渡す役割のビットと目標枚数（_role_targets_by_bitと同じ並び）
+        self._role_bits = np.array(list(self._role_targets_by_bit), dtype=np.int64)
+        self._role_target_counts = np.array(
+            [target for _, target in self._role_targets_by_bit.values()], dtype=np.float64
+        )
+        
+        # 有効なスナップショットがあればcard_id→カード情報をSQLiteを介さず引く
+        # （書き出しはカードデータを構築したビルダー側で行う）
+        self.snapshot_path = card_snapshot_path(db_path)
+        self._cards_by_id: Optional[Dict[str, Dict[str, Any]]] = None
+        # DBと版が合わず使わなかったスナップショットファイル（更新時刻, サイズ）
+        self._rejected_snapshot: Optional[Tuple[int, int]] = None
+        self._snapshot_retry_at = 0.0
+        self._load_card_snapshot()
+        
+        # DBの版が変わったら（別プロセスでの再構築を含む）カード情報キャッシュを捨てる
+        self.card_data = card_data_watcher(db_path)
+        self.card_data.register(self._on_card_data_changed)
+
+    def _get_conn(self) -> sqlite3.Connection:
+        """スレッドごとの読み取り専用SQLite接続を取得（初回のみ接続）"""
+        conn = getattr(self._conn_local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA query_only=1")
+            conn.execute("PRAGMA cache_size=-20000")
+            conn.execute("PRAGMA mmap_size=268435456")
+            conn.row_factory = sqlite3.Row
+            self._conn_local.conn = conn
+        return conn
+
+    def _card_fingerprint(self) -> Optional[Tuple[str, str]]:
+        """現在のカードデータの版（テーブル未作成ならNone）"""
+        try:
+            return tuple(self._get_conn().execute(CARD_FINGERPRINT_SQL).fetchone())
+        except sqlite3.OperationalError:
+            return None
+
+    def _load_card_snapshot(self) -> bool:
+        """スナップショットを読み込む（無い・壊れている・DBと版が違う場合はFalse）"""
+        try:
+            stat = os.stat(self.snapshot_path)
+        except OSError:
+            return False
+        # 版が合わなかったファイルから書き換わっていなければ読み直さない
+        file_key = (stat.st_mtime_ns, stat.st_size)
+        if file_key == self._rejected_snapshot:
+            return False
+        
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                snapshot = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return False
+        
+        fingerprint = self._card_fingerprint()
+        if fingerprint is None or snapshot.get("fingerprint") != fingerprint:
+            self._rejected_snapshot = file_key
+            return False
+        self._cards_by_id = snapshot["cards"]
+        return True
+
+    def _on_card_data_changed(self):
+        """カードデータ更新時の無効化処理（スナップショットも新しい版を読み直す）"""
+        # 読み直すまでの間はSQLiteから引く
+        self._cards_by_id = None
+        card_info_cache.clear()
+        self._rejected_snapshot = None
+        self._load_card_snapshot()
+
+    def _check_card_data(self):
+        """カードデータの版を確認し、スナップショット未使用なら書き出されたか一定間隔で確かめる"""
+        self.card_data.check()
+        if self._cards_by_id is None:
+            now = time.monotonic()
+            if now >= self._snapshot_retry_at:
+                self._snapshot_retry_at = now + self.card_data.interval
+                self._load_card_snapshot()
 
-    @cached_method(card_info_cache, "card_info")
     def get_card_info(self, card_id: str) -> Optional[Dict[str, Any]]:
-        """キャッシュ対応のカード情報取得"""
-        # 既存の実装をそのまま使用（デコレータがキャッシュを処理）
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute("""
-                SELECT c.*, m.base_rating, m.stat_efficiency, m.role_score,
-                       m.keyword_score, m.rarity_bonus, m.impact_score
-                FROM cards c
-                LEFT JOIN card_metrics m ON c.card_id = m.card_id
-                WHERE c.card_id = ?
-            """, (card_id,))
-            
-            row = cursor.fetchone()
-            if not row:
-                return None
-            
-            columns = [desc[0] for desc in cursor.description]
-            card = dict(zip(columns, row))
-            
-            # JSON文字列を変換
-            card["roles"] = json.loads(card["roles"] or "[]")
-            card["keywords"] = json.loads(card["keywords"] or "[]")
-            
-            return card
+        """キャッシュ対応のカード情報取得（カードデータが更新されていればキャッシュを捨ててから引く）"""
+        self._check_card_data()
+        return self._cached_card_info(card_id)
+
+    @cached_method(card_info_cache, "card_info")
+    def _cached_card_info(self, card_id: str) -> Optional[Dict[str, Any]]:
+        """キャッシュ対応のカード情報取得（版の確認なし）"""
+        # キャッシュミス時のみ到達（デコレータがキャッシュを処理）
+        cards_by_id = self._cards_by_id
+        if cards_by_id is not None:
+            return cards_by_id.get(card_id)
+        
+        cursor = self._get_conn().execute(CARD_INFO_SQL, (card_id,))
+        
+        row = cursor.fetchone()
+        if not row:
+            return None
+        
+        return _row_to_card(row)
+
+    def get_cards_bulk(self, card_ids: Iterable[str]) -> int:
+        """未キャッシュのカード情報をIN句でまとめて取得し、get_card_infoのキャッシュに入れる"""
+        self._check_card_data()
+        missing = [
+            card_id for card_id in dict.fromkeys(card_ids)
+            if _card_info_key(card_id) not in card_info_cache
+        ]
+        
+        cards_by_id = self._cards_by_id
+        if cards_by_id is not None:
+            for card_id in missing:
+                card = cards_by_id.get(card_id)
+                if card is not None:
+                    card_info_cache.set(_card_info_key(card_id), card)
+            return len(missing)
+        
+        conn = self._get_conn()
+        for start in range(0, len(missing), BULK_FETCH_CHUNK):
+            chunk = missing[start:start + BULK_FETCH_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            cursor = conn.execute(f"{CARD_INFO_SELECT} WHERE c.card_id IN ({placeholders})", chunk)
+            for row in cursor:
+                card = _row_to_card(row)
+                card_info_cache.set(_card_info_key(card["card_id"]), card)
+        return len(missing)
+
+    def warm_card_cache(self) -> int:
+        """全カード（トークン除く）の情報をキャッシュに事前読み込み"""
+        self._check_card_data()
+        cards_by_id = self._cards_by_id
+        if cards_by_id is not None:
+            card_ids = [card_id for card_id, card in cards_by_id.items() if not card["is_token"]]
+        else:
+            card_ids = [row[0] for row in self._get_conn().execute(
+                "SELECT card_id FROM cards WHERE is_token = 0"
+            )]
+        
+        self.get_cards_bulk(card_ids)
+        return len(card_ids)
 
     def get_cache_stats(self) -> Dict[str, Any]:
         """キャッシュ統計を取得"""
         return card_info_cache.get_stats()
 
+    def update_state(self, state: DeckState, card_id: str) -> DeckState:
+        """デッキ集計にピックした1枚を加える"""
+        state.total += 1
+        state.card_counts[card_id] += 1
+        card = self.get_card_info(card_id)
+        if card:
+            state.curve[card["cost"]] += 1
+            state.roles.update(card["roles"])
+        return state
+
+    def build_state(self, deck_card_ids: List[str]) -> DeckState:
+        """デッキ全体からデッキ集計を作成"""
+        state = DeckState()
+        for card_id in deck_card_ids:
+            self.update_state(state, card_id)
+        return state
+
     def analyze_deck(self, deck_card_ids: List[str]) -> Dict[str, Any]:
         """現在のデッキを分析"""
-        curve = {}
-        roles = {}
-        total_cards = len(deck_card_ids)
-        
-        for card_id in deck_card_ids:
-            card = self.get_card_info(card_id)
-            if not card:
-                continue
-            
-            # マナカーブ
-            cost = card["cost"]
-            curve[cost] = curve.get(cost, 0) + 1
-            
-            # 役割
-            for role in card["roles"]:
-                roles[role] = roles.get(role, 0) + 1
-        
-        return {
-            "total_cards": total_cards,
-            "curve": curve,
-            "roles": roles
-        }
+        return self.build_state(deck_card_ids).as_analysis()
 
-    def calculate_curve_bonus(self, card_cost: int, deck_analysis: Dict[str, Any], 
-                            pick_index: int) -> float:
-        """マナカーブ補正を計算"""
-        current_count = deck_analysis["curve"].get(card_cost, 0)
-        ideal_count = self.ideal_curve.get(card_cost, 1)
-        
-        # 進行度に応じた目標調整
+    def curve_tables(self, deck_analysis: Dict[str, Any]) -> CurveTables:
+        """カーブ補正用の表を作成（候補間で共有）"""
+        curve = deck_analysis["curve"]
         progress = deck_analysis["total_cards"] / 30
-        adjusted_target = ideal_count * progress
-        
-        bonus = 0.0
-        if current_count < adjusted_target:
-            shortage = adjusted_target - current_count
-            bonus = min(shortage * 8, 15)
-            
-            # 序盤は低コスト重視
-            if pick_index <= 8 and card_cost <= 3:
-                bonus *= 1.3
-        elif current_count > adjusted_target * 1.5:
-            excess = current_count - adjusted_target
-            bonus = -min(excess * 5, 10)
-        
-        return bonus
+        ideal = self._ideal_curve_table
+        # デッキに11コスト以上があれば表を伸ばす
+        size = max(CURVE_TABLE_SIZE, max(curve, default=0) + 1)
+        if size > len(ideal):
+            ideal = ideal + tuple(self.ideal_curve.get(c, 1) for c in range(len(ideal), size))
+        return CurveTables(
+            current=tuple(curve.get(c, 0) for c in range(size)),
+            targets=tuple(count * progress for count in ideal),
+            progress=progress
+        )
+
+    def _curve_lookup(self, tables: CurveTables, card_cost: int) -> Tuple[int, float]:
+        """(現在枚数, 調整済み目標枚数)を表から引く"""
+        if 0 <= card_cost < len(tables.current):
+            return tables.current[card_cost], tables.targets[card_cost]
+        # 表の範囲外のコストはデッキに存在しない
+        return 0, self.ideal_curve.get(card_cost, 1) * tables.progress
+
+    def calculate_curve_bonus(self, card_cost: int, tables: CurveTables,
+                            pick_index: int) -> float:
+        """マナカーブ補正を計算（tablesはcurve_tablesの結果）"""
+        current_count, adjusted_target = self._curve_lookup(tables, card_cost)
+        return _curve_bonus(current_count, adjusted_target, card_cost, pick_index)
 
-    def calculate_role_bonus(self, card_roles: List[str], 
+    def calculate_role_bonus(self, roles_mask: int, 
                            deck_analysis: Dict[str, Any]) -> float:
-        """役割補正を計算"""
+        """役割補正を計算（roles_maskはROLE_BITSのビット和）"""
         bonus = 0.0
         
-        for role in card_roles:
-            if role not in self.role_targets:
-                continue
-            
-            current_count = deck_analysis["roles"].get(role, 0)
-            target_count = self.role_targets[role]
-            
-            if current_count < target_count:
-                shortage = target_count - current_count
-                bonus += min(shortage * 6, 12)
-            elif current_count >= target_count * 1.5:
-                bonus -= 5
+        # 目標のある役割のビットだけを下位から順に処理
+        mask = roles_mask & self._role_target_mask
+        while mask:
+            bit = mask & -mask
+            mask ^= bit
+            role, target_count = self._role_targets_by_bit[bit]
+            bonus += _role_bonus(deck_analysis["roles"].get(role, 0), target_count)
         
         return bonus
 
@@ -157,49 +487,44 @@ class TwoPickAdvisor:
 
     def get_pick_advice(self, candidate_card_ids: List[str], 
                        current_deck_ids: List[str], pick_index: int, 
-                       rerolls_left: int) -> PickAdvice:
-        """ピックアドバイスを生成"""
-        deck_analysis = self.analyze_deck(current_deck_ids)
-        card_scores = []
-        
-        # 各候補カードを評価
-        for card_id in candidate_card_ids:
-            card = self.get_card_info(card_id)
-            if not card:
-                continue
-            
-            base_score = card.get("base_rating", 50.0)
-            curve_bonus = self.calculate_curve_bonus(
-                card["cost"], deck_analysis, pick_index
-            )
-            role_bonus = self.calculate_role_bonus(
-                card["roles"], deck_analysis
-            )
-            
-            # 重複ペナルティ
-            duplication_penalty = 0
-            if card_id in current_deck_ids:
-                count = current_deck_ids.count(card_id)
-                duplication_penalty = -5 * count
-            
-            final_score = base_score + curve_bonus + role_bonus + duplication_penalty
-            
-            card_scores.append({
-                "card_id": card_id,
-                "name": card["name"],
-                "cost": card["cost"],
-                "base_score": base_score,
-                "curve_bonus": curve_bonus,
-                "role_bonus": role_bonus,
-                "duplication_penalty": duplication_penalty,
-                "final_score": final_score
-            })
-        
-        if not card_scores:
+                       rerolls_left: int,
+                       deck_state: Optional[DeckState] = None) -> PickAdvice:
+        """ピックアドバイスを生成（deck_stateを渡すとデッキの再集計を省略）"""
+        if deck_state is None:
+            # 候補とデッキのカード情報を1回のクエリで先読み
+            self.get_cards_bulk([*candidate_card_ids, *current_deck_ids])
+            deck_state = self.build_state(current_deck_ids)
+        deck_analysis = deck_state.as_analysis()
+        cards = [card for card in map(self.get_card_info, candidate_card_ids) if card]
+        if not cards:
             return PickAdvice("pick", None, None, 0, ["評価可能なカードがありません"], [])
         
-        # 最高スコアのカードを特定
-        best_card = max(card_scores, key=lambda x: x["final_score"])
+        # 各候補カードを評価（候補×要素を要素ごとの配列で持ち、一括計算）
+        tables = self.curve_tables(deck_analysis)
+        curve_lookups = [self._curve_lookup(tables, card["cost"]) for card in cards]
+        deck_roles = deck_analysis["roles"]
+        deck_counter = deck_state.card_counts
+        
+        base_scores = np.array([card.get("base_rating", 50.0) for card in cards], dtype=np.float64)
+        dup_penalties = np.array([-5 * deck_counter.get(card["card_id"], 0) for card in cards], dtype=np.int64)
+        curve_bonus, role_bonus = _score_batch(
+            np.array([current for current, _ in curve_lookups], dtype=np.float64),
+            np.array([target for _, target in curve_lookups], dtype=np.float64),
+            np.array([card["cost"] for card in cards], dtype=np.int64),
+            np.array([card["roles_mask"] for card in cards], dtype=np.int64),
+            self._role_bits,
+            np.array([deck_roles.get(role, 0) for role, _ in self._role_targets_by_bit.values()],
+                     dtype=np.float64),
+            self._role_target_counts,
+            pick_index
+        )
+        final_scores = base_scores + curve_bonus + role_bonus + dup_penalties
+        
+        # 返却用の辞書は参照時に配列から作る
+        card_scores = CardScoresView(cards, curve_bonus, role_bonus, dup_penalties, final_scores)
+        
+        # 最高スコアのカードを特定（辞書を作るのはこの1枚だけ）
+        best_card = card_scores[int(final_scores.argmax())]
         best_score = best_card["final_score"]
         
         # リロール判断
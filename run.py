@@ -8,5 +8,6 @@ if __name__ == '__main__':
     app.run(
         host=APP_CONFIG['host'],
         port=APP_CONFIG['port'],
-        debug=APP_CONFIG['debug']
+        debug=APP_CONFIG['debug'],
+        threaded=APP_CONFIG['threaded']
     )
@@ -1,12 +1,28 @@
 import requests
 import json
+import math
 import time
 import sqlite3
 import re
 import logging
+import threading
+import heapq
+from collections import defaultdict
+from functools import reduce
+from itertools import islice
+from operator import itemgetter, or_
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime
+from config import ROLE_BITS
+from pick_advisor import write_card_snapshot
+
+try:
+    import orjson
+except ImportError:  # orjson未導入環境では標準jsonを使用
+    orjson = None
 
 # ログ設定
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -41,21 +57,33 @@ class NormalizedCard:
     synergy_tags: List[str] = field(default_factory=list)
     keywords: List[str] = field(default_factory=list)
 
+# テキスト整形・キーワード抽出用の正規表現（モジュール読み込み時に1回だけコンパイル）
+# ルビ / タグ / 空白（間のタグごと1つにまとめる）を1回の走査で処理する
+_CLEAN_RX = re.compile(
+    r'<ruby[^>]*>([^<]+)<rt>.*?</rt></ruby>'
+    r'|<[^>]+>'
+    r'|\s+(?:(?:<(?!ruby)[^>]+>)+\s+)*'
+)
+_KEYWORD_RX = re.compile(r'<color=Keyword>(.*?)</color>')
+
+def _clean_repl(match: re.Match) -> str:
+    """ルビは漢字のみ残し、タグは除去し、空白は1つにまとめる"""
+    kanji = match.group(1)
+    if kanji is not None:
+        return kanji
+    return '' if match.group(0)[0] == '<' else ' '
+
 def clean_html_text(text: str) -> str:
     """HTMLタグとルビを除去してクリーンなテキストを生成"""
     if not text:
         return ""
     
-    # <ruby>タグの処理（漢字のみ残す）
-    text = re.sub(r'<ruby[^>]*>([^<]+)<rt>.*?</rt></ruby>', r'\1', text)
-    
-    # その他のHTMLタグを除去
-    text = re.sub(r'<[^>]+>', '', text)
-    
-    # 連続する空白を整理
-    text = re.sub(r'\s+', ' ', text)
-    
-    return text.strip()
+    # <ruby>は漢字のみ残し、その他のタグ除去と空白の整理も同じ走査で行う
+    return _CLEAN_RX.sub(_clean_repl, text).strip()
+
+def roles_to_mask(roles: List[str]) -> int:
+    """役割一覧をROLE_BITSのビット和にする"""
+    return reduce(or_, (ROLE_BITS[role] for role in roles), 0)
 
 def extract_keywords(text: str) -> List[str]:
     """スキルテキストからキーワードを抽出"""
@@ -63,8 +91,31 @@ def extract_keywords(text: str) -> List[str]:
         return []
     
     # <color=Keyword>で囲まれたキーワードを抽出
-    keywords = re.findall(r'<color=Keyword>(.*?)</color>', text)
-    return list(set(keywords))  # 重複除去
+    return list(set(_KEYWORD_RX.findall(text)))  # 重複除去
+
+# カード一覧APIの1ページあたり件数
+PAGE_SIZE = 30
+# ページ取得の並列数とリクエスト開始間隔（秒）
+FETCH_WORKERS = 6
+REQUEST_INTERVAL = 0.5
+# ページ取得の試行回数（1ページ目はマッピング情報を含むため多めに試す）
+PAGE_FETCH_ATTEMPTS = 2
+FIRST_PAGE_FETCH_ATTEMPTS = 3
+
+class _RateLimiter:
+    """スレッド間で共有し、リクエストの開始間隔を一定以上に保つ"""
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
 
 class ShadowverseCardFetcher:
     def __init__(self):
@@ -76,6 +127,10 @@ class ShadowverseCardFetcher:
             'Accept': 'application/json',
             'Accept-Language': 'ja,en-US;q=0.9'
         })
+        # 並列取得用に接続プールを広げる
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=8)
+        self.session.mount('https://', adapter)
+        self._rate_limiter = _RateLimiter(REQUEST_INTERVAL)
         
         # 基本マッピング
         self.class_mapping = {
@@ -97,16 +152,18 @@ class ShadowverseCardFetcher:
         self.skill_names = {}
 
     def fetch_single_page(self, page: int) -> Optional[Dict[str, Any]]:
-        """単一ページのデータを取得"""
-        self.session.headers.update({'Referer': f'https://shadowverse-wb.com/ja/deck/cardslist/?page={page}&class=0,1,2,3,4,5,6,7&cost=0,1,2,3,4,5,6,7,8,9,10'})
+        """単一ページのデータを取得（複数スレッドから呼ばれる）"""
+        # Refererはページごとに異なるため、共有セッションではなくリクエスト単位で渡す
+        headers = {'Referer': f'https://shadowverse-wb.com/ja/deck/cardslist/?page={page}&class=0,1,2,3,4,5,6,7&cost=0,1,2,3,4,5,6,7,8,9,10'}
         
         params = {
-            'offset': 30 * (page - 1),
+            'offset': PAGE_SIZE * (page - 1),
             'class': '0,1,2,3,4,5,6,7',
             'cost': '0,1,2,3,4,5,6,7,8,9,10'
         }
         try:
-            response = self.session.get(self.base_url, params=params, timeout=30)
+            self._rate_limiter.wait()
+            response = self.session.get(self.base_url, params=params, headers=headers, timeout=30)
             response.raise_for_status()
             
             data = response.json()
@@ -139,61 +196,69 @@ class ShadowverseCardFetcher:
             
         return 'data' in data
 
+    def fetch_page_with_retry(self, page: int, attempts: int = PAGE_FETCH_ATTEMPTS) -> Optional[Dict[str, Any]]:
+        """失敗したページは間隔を空けて再試行し、それでも取れなければNone"""
+        for attempt in range(attempts):
+            if attempt:
+                time.sleep(1)
+                logger.info(f"ページ {page} 再試行中...")
+            response_data = self.fetch_single_page(page)
+            if response_data is not None:
+                return response_data
+        logger.error(f"ページ {page}: 取得失敗のためスキップ")
+        return None
+
     def fetch_all_cards(self) -> List[Dict[str, Any]]:
-        """全カードデータを取得"""
+        """全カードデータを取得（1ページ目の総数でページ数を確定し、2ページ目以降は並列取得）"""
         all_cards = []
-        page = 1
         max_pages = 100  # 安全装置
-        consecutive_empty = 0
         
         logger.info("カードデータ取得開始...")
         
-        while page <= max_pages and consecutive_empty < 3:
-            logger.info(f"ページ {page} 処理中...")
-            
-            response_data = self.fetch_single_page(page)
+        # 1ページ目でマッピング情報と総カード数を取得
+        logger.info("ページ 1 処理中...")
+        first_page = self.fetch_page_with_retry(1, attempts=FIRST_PAGE_FETCH_ATTEMPTS)
+        if first_page is None:
+            logger.info(f"取得完了: 合計 {len(all_cards)} 枚")
+            return all_cards
+        
+        data = first_page.get('data', {})
+        self.tribe_names = {int(k): v for k, v in data.get('tribe_names', {}).items()}
+        self.card_set_names = {int(k): v for k, v in data.get('card_set_names', {}).items()}
+        self.skill_names = {int(k): v for k, v in data.get('skill_names', {}).items()}
+        
+        total_count = data.get('count', 0)
+        logger.info(f"総カード数: {total_count}")
+        if not total_count:
+            logger.warning("総カード数が取得できないため1ページ目のみ処理")
+        last_page = max(1, min(max_pages, math.ceil(total_count / PAGE_SIZE)))
+        
+        def add_page(page: int, response_data: Optional[Dict[str, Any]]):
+            """1ページ分のカードを追加"""
             if not response_data:
-                consecutive_empty += 1
-                page += 1
-                time.sleep(1)
-                continue
+                return
             
             data = response_data.get('data', {})
             
-            # 初回のみマッピング情報を取得
-            if page == 1:
-                self.tribe_names = {int(k): v for k, v in data.get('tribe_names', {}).items()}
-                self.card_set_names = {int(k): v for k, v in data.get('card_set_names', {}).items()}
-                self.skill_names = {int(k): v for k, v in data.get('skill_names', {}).items()}
-                
-                total_count = data.get('count', 0)
-                logger.info(f"総カード数: {total_count}")
-            
             # カードデータを抽出
             card_details = data.get('card_details', {})
-            sort_card_ids = data.get('sort_card_id_list', [])
-            
-            if not sort_card_ids:
-                logger.info("カードリスト終了")
-                break
-            
             page_cards = []
-            for card_id in sort_card_ids:
-                card_id_str = str(card_id)
-                if card_id_str in card_details:
-                    card_info = card_details[card_id_str]
-                    if 'common' in card_info:
-                        page_cards.append(card_info)
+            for card_id in data.get('sort_card_id_list', []):
+                card_info = card_details.get(str(card_id))
+                if card_info and 'common' in card_info:
+                    page_cards.append(card_info)
             
-            if page_cards:
-                all_cards.extend(page_cards)
-                consecutive_empty = 0
-                logger.info(f"ページ {page}: {len(page_cards)}枚取得 (累計: {len(all_cards)}枚)")
-            else:
-                consecutive_empty += 1
-            
-            page += 1
-            time.sleep(0.5)  # レート制限対策
+            all_cards.extend(page_cards)
+            logger.info(f"ページ {page}: {len(page_cards)}枚取得 (累計: {len(all_cards)}枚)")
+        
+        add_page(1, first_page)
+        if last_page > 1:
+            logger.info(f"ページ 2-{last_page} 処理中...")
+            with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+                # 結果はページ順に処理する
+                pages = range(2, last_page + 1)
+                for page, result in zip(pages, executor.map(self.fetch_page_with_retry, pages)):
+                    add_page(page, result)
         
         logger.info(f"取得完了: 合計 {len(all_cards)} 枚")
         return all_cards
@@ -237,6 +302,14 @@ class CardDataProcessor:
             'fusion': [r'融合'],
             'awakening': [r'覚醒']
         }
+        
+        # 種類ごとのパターンを1つの選択正規表現にまとめてコンパイル
+        self._role_regex = {
+            role: re.compile("|".join(patterns)) for role, patterns in self.role_patterns.items()
+        }
+        self._synergy_regex = {
+            synergy: re.compile("|".join(patterns)) for synergy, patterns in self.synergy_patterns.items()
+        }
 
     def normalize_card(self, raw_card: Dict[str, Any]) -> Optional[NormalizedCard]:
         """カードデータを正規化"""
@@ -307,27 +380,12 @@ class CardDataProcessor:
 
     def _analyze_roles(self, text: str) -> List[str]:
         """役割を分析"""
-        roles = []
-        text_lower = text.lower()
-        
-        for role, patterns in self.role_patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, text):
-                    roles.append(role)
-                    break
-        
-        return roles
+        return [role for role, regex in self._role_regex.items() if regex.search(text)]
 
     def _analyze_synergies(self, text: str, keywords: List[str]) -> List[str]:
         """シナジーを分析"""
-        synergies = []
-        
         # テキストパターンから
-        for synergy, patterns in self.synergy_patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, text):
-                    synergies.append(synergy)
-                    break
+        synergies = [synergy for synergy, regex in self._synergy_regex.items() if regex.search(text)]
         
         # キーワードから直接
         keyword_synergies = {
@@ -344,9 +402,28 @@ class CardDataProcessor:
         
         return list(set(synergies))
 
+INSERT_CARD_SQL = """
+    INSERT OR REPLACE INTO cards 
+    (card_id, name, class_id, class_name, cost, card_type, rarity,
+     attack, defense, evolved_attack, evolved_defense,
+     skill_text, evo_skill_text, flavour_text, tribes, card_set_id,
+     is_token, cv, illustrator, base_rating, roles, synergy_tags, keywords,
+     roles_mask, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+"""
+
+# 2Pick候補索引の読み込み（get_cards_by_class_costは全列の行を返す）
+CLASS_COST_INDEX_SQL = """
+    SELECT * FROM cards
+    WHERE is_token = 0
+    ORDER BY base_rating DESC
+"""
+
 class CardDatabase:
     def __init__(self, db_path: str = "shadowverse_cards.db"):
         self.db_path = db_path
+        # (class_id, cost)→評価順のカード一覧（preload_indexで構築）
+        self._index: Optional[Dict[Tuple[int, int], List[Dict[str, Any]]]] = None
         self.init_database()
     
     def init_database(self):
@@ -377,60 +454,105 @@ class CardDatabase:
                     roles TEXT,  -- JSON
                     synergy_tags TEXT,  -- JSON
                     keywords TEXT,  -- JSON
+                    roles_mask INTEGER DEFAULT 0,  -- ROLE_BITSのビット和
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             """)
             
+            # roles_mask列のない旧DBは列を追加し、roles列から埋める
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(cards)")}
+            if "roles_mask" not in columns:
+                conn.execute("ALTER TABLE cards ADD COLUMN roles_mask INTEGER DEFAULT 0")
+                conn.executemany(
+                    "UPDATE cards SET roles_mask = ? WHERE card_id = ?",
+                    [
+                        (roles_to_mask(json.loads(roles or "[]")), card_id)
+                        for card_id, roles in conn.execute("SELECT card_id, roles FROM cards").fetchall()
+                    ]
+                )
+                logger.info("roles_mask列を追加しました")
+            
             # インデックス作成
             indexes = [
                 "CREATE INDEX IF NOT EXISTS idx_class_cost ON cards (class_id, cost)",
                 "CREATE INDEX IF NOT EXISTS idx_card_type ON cards (card_type)",
                 "CREATE INDEX IF NOT EXISTS idx_rarity ON cards (rarity)",
-                "CREATE INDEX IF NOT EXISTS idx_is_token ON cards (is_token)"
+                "CREATE INDEX IF NOT EXISTS idx_is_token ON cards (is_token)",
+                "CREATE INDEX IF NOT EXISTS idx_cards_name ON cards (name)",
+                "CREATE INDEX IF NOT EXISTS idx_cards_class_token ON cards (class_id, is_token)"
             ]
             
             for index_sql in indexes:
                 conn.execute(index_sql)
+            # 2Pick候補はメモリ上の索引から引くため、旧版で作った検索用インデックスは削除
+            conn.execute("DROP INDEX IF EXISTS idx_class_cost_rating")
             
             conn.commit()
     
     def insert_cards(self, cards: List[NormalizedCard]):
         """カードデータ一括挿入"""
+        rows = (
+            (
+                card.card_id, card.name, card.class_id, card.class_name,
+                card.cost, card.card_type, card.rarity, card.attack, card.defense,
+                card.evolved_attack, card.evolved_defense, card.skill_text,
+                card.evo_skill_text, card.flavour_text, json.dumps(card.tribes),
+                card.card_set_id, card.is_token, card.cv, card.illustrator,
+                card.base_rating, json.dumps(card.roles), json.dumps(card.synergy_tags),
+                json.dumps(card.keywords), roles_to_mask(card.roles)
+            )
+            for card in cards
+        )
+        
         with sqlite3.connect(self.db_path) as conn:
-            for card in cards:
-                conn.execute("""
-                    INSERT OR REPLACE INTO cards 
-                    (card_id, name, class_id, class_name, cost, card_type, rarity,
-                     attack, defense, evolved_attack, evolved_defense,
-                     skill_text, evo_skill_text, flavour_text, tribes, card_set_id,
-                     is_token, cv, illustrator, base_rating, roles, synergy_tags, keywords,
-                     updated_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                """, (
-                    card.card_id, card.name, card.class_id, card.class_name,
-                    card.cost, card.card_type, card.rarity, card.attack, card.defense,
-                    card.evolved_attack, card.evolved_defense, card.skill_text,
-                    card.evo_skill_text, card.flavour_text, json.dumps(card.tribes),
-                    card.card_set_id, card.is_token, card.cv, card.illustrator,
-                    card.base_rating, json.dumps(card.roles), json.dumps(card.synergy_tags),
-                    json.dumps(card.keywords)
-                ))
-            
+            # 一括書き込み中はfsyncを減らし、1トランザクションで確定
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("BEGIN")
+            conn.executemany(INSERT_CARD_SQL, rows)
             conn.commit()
             logger.info(f"{len(cards)} 枚のカードを保存")
+        # 再構築したので候補索引は作り直す
+        self._index = None
 
-    def get_cards_by_class_cost(self, class_id: int, cost: int) -> List[Dict[str, Any]]:
-        """クラスとコストでカード検索（2Pick用）"""
+    def rebuild_card_full(self):
+        """メトリクス構築済みのDBならcard_fullもカード情報に合わせて作り直す"""
+        # build_card_metricsは読み込み時にログ設定を行うため、ここで遅延インポート
+        from build_card_metrics import build_card_full_table
+        
         with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute("""
-                SELECT * FROM cards 
-                WHERE class_id IN (0, ?) AND cost = ? AND is_token = 0
-                ORDER BY base_rating DESC
-            """, (class_id, cost))
-            
-            columns = [desc[0] for desc in cursor.description]
-            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+            has_metrics = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'card_metrics'"
+            ).fetchone()
+            if has_metrics:
+                build_card_full_table(conn)
+
+    def preload_index(self) -> Dict[Tuple[int, int], List[Dict[str, Any]]]:
+        """トークン以外の全カードを(class_id, cost)ごとの評価順リストとしてメモリに読み込む"""
+        index = defaultdict(list)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            for row in conn.execute(CLASS_COST_INDEX_SQL):
+                card = dict(row)
+                index[(card["class_id"], card["cost"])].append(card)
+        
+        self._index = dict(index)
+        return self._index
+
+    def get_cards_by_class_cost(self, class_id: int, cost: int,
+                                limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """クラスとコストでカード検索（2Pick用、評価順。limitを指定すると上位のみ）"""
+        if self._index is None:
+            self.preload_index()
+        
+        # クラスカードとニュートラルはそれぞれ評価順なので併合する
+        lists = [self._index.get((0, cost), [])]
+        if class_id != 0:
+            lists.append(self._index.get((class_id, cost), []))
+        merged = heapq.merge(*lists, key=itemgetter("base_rating"), reverse=True)
+        return [dict(card) for card in islice(merged, limit)]
 
 def main():
     """メイン実行関数"""
@@ -445,8 +567,13 @@ def main():
         
         # バックアップ保存
         backup_file = f"raw_cards_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(backup_file, "w", encoding="utf-8") as f:
-            json.dump(raw_cards, f, ensure_ascii=False, indent=2)
+        if orjson is not None:
+            # C実装のエンコーダで一括変換し、1回で書き込む
+            with open(backup_file, "wb") as f:
+                f.write(orjson.dumps(raw_cards, option=orjson.OPT_INDENT_2))
+        else:
+            with open(backup_file, "w", encoding="utf-8") as f:
+                json.dump(raw_cards, f, ensure_ascii=False, indent=2)
         logger.info(f"バックアップ保存: {backup_file}")
         
         # Step 2: データ正規化
@@ -466,6 +593,12 @@ def main():
         # Step 3: データベース保存
         db = CardDatabase()
         db.insert_cards(normalized_cards)
+        db.rebuild_card_full()
+        
+        # アドバイザー用のスナップショットはここで書き出す（各ワーカーは読むだけ）
+        snapshot_count = write_card_snapshot(db.db_path)
+        if snapshot_count:
+            logger.info(f"カードスナップショット書き出し: {snapshot_count} 枚")
         
         # Step 4: 統計表示
         display_statistics(db)
@@ -1,24 +1,180 @@
 # synergy_engine.py
 import sqlite3
-import json
+import itertools
 import re
-from typing import Dict, List, Any, Tuple
-from dataclasses import dataclass
+import threading
+from typing import Dict, List, Any, Optional, Tuple
+from dataclasses import dataclass, field
+from cache_system import SimpleCache, card_data_watcher
 
-@dataclass
+# クラスIDの数（0: ニュートラル、1〜7: 各クラス）
+CLASS_COUNT = 8
+
+# 1回のIN句で問い合わせるカードIDの最大数
+BULK_FETCH_CHUNK = 500
+
+# 正規表現の特殊文字（これを含まないパターンは文字列の包含判定で済む）
+_REGEX_META = re.compile(r"[.^$*+?{}\[\]\\|()]")
+
+# 大文字のエスケープ（\D, \Wなど）は小文字化すると意味が変わる
+_UPPER_ESCAPE = re.compile(r"\\[A-Z]")
+
+def lower_pattern(pattern: str) -> str:
+    """小文字化したテキストに使うパターン（意味が変わる場合はIGNORECASEで包む）"""
+    if _UPPER_ESCAPE.search(pattern):
+        return f"(?i:{pattern})"
+    return pattern.lower()
+
+def split_literal_patterns(patterns: List[str]) -> Tuple[List[str], List[re.Pattern]]:
+    """パターンを(包含判定で済む文字列, コンパイル済み正規表現)に分ける
+    
+    いずれも小文字化済みのテキストに対して使う（IGNORECASEの代わり）。
+    """
+    literals, regexes = [], []
+    for p in map(lower_pattern, patterns):
+        if not _REGEX_META.search(p):
+            literals.append(p)
+        else:
+            regexes.append(re.compile(p))
+    return literals, regexes
+
+@dataclass(slots=True)
 class SynergyRule:
-    """シナジールールの定義"""
+    """シナジールールの定義（属性参照が多いため__slots__で持つ）"""
     name: str
     enabler_patterns: List[str]  # 基盤を提供するパターン
     payoff_patterns: List[str]   # 基盤を活用するパターン
     min_threshold: int           # 発動最小枚数
     max_bonus: float            # 最大ボーナス
     bonus_per_card: float       # カード1枚あたりのボーナス
+    enabler_literals: List[str] = field(init=False, repr=False)
+    enabler_regexes: List[re.Pattern] = field(init=False, repr=False)
+    payoff_literals: List[str] = field(init=False, repr=False)
+    payoff_regexes: List[re.Pattern] = field(init=False, repr=False)
+    rule_id: int = field(init=False, default=-1)  # カードのマスクでのビット位置（エンジンが割り当てる）
+
+    def __post_init__(self):
+        # パターンは生成時に1回だけコンパイルしておく（単純な文字列は包含判定にする）
+        self.enabler_literals, self.enabler_regexes = split_literal_patterns(self.enabler_patterns)
+        self.payoff_literals, self.payoff_regexes = split_literal_patterns(self.payoff_patterns)
+
+    def is_enabler(self, text: str) -> bool:
+        """小文字化したテキストがエネーブラーのパターンに一致するか"""
+        return (any(literal in text for literal in self.enabler_literals)
+                or any(rx.search(text) for rx in self.enabler_regexes))
+
+    def is_payoff(self, text: str) -> bool:
+        """小文字化したテキストがペイオフのパターンに一致するか"""
+        return (any(literal in text for literal in self.payoff_literals)
+                or any(rx.search(text) for rx in self.payoff_regexes))
+
+def fuse_rule_patterns(rules: List[SynergyRule]) -> re.Pattern:
+    """ルール群の全パターンを1つの選択正規表現にまとめる（小文字化したテキストの事前判定用）"""
+    patterns = [lower_pattern(p) for rule in rules for p in rule.enabler_patterns + rule.payoff_patterns]
+    return re.compile("|".join(f"(?:{p})" for p in patterns))
 
 class SynergyEngine:
     def __init__(self, db_path: str = "shadowverse_cards.db"):
         self.db_path = db_path
+        self._conn_local = threading.local()
+        # close()で全スレッド分を閉じるため開いた接続を記録
+        self._conns: List[sqlite3.Connection] = []
+        self._conns_lock = threading.Lock()
+        # card_id→カード情報（初回参照時にまとめて読み込み、refreshまで保持）
+        self._card_cache: Dict[str, Dict[str, Any]] = {}
+        # デッキ構成（入力順）→シナジー分析結果
+        self._deck_cache = SimpleCache(max_size=32, ttl_seconds=None)
+        # 直近に分析したデッキ（キー, 結果）。同じピック内の候補評価はここで済ませる
+        self._current_deck: Optional[Tuple[tuple, Dict[str, Any]]] = None
         self.synergy_rules = self._initialize_synergy_rules()
+        # カードデータの版が変わったらカード情報を読み込み直す
+        self.card_data = card_data_watcher(db_path)
+        self.card_data.register(self.refresh)
+        
+        # 全ルールに通し番号を振り、カードごとの一致をビットマスクで持つ
+        self._all_rules = [rule for rules in self.synergy_rules.values() for rule in rules]
+        for rule_id, rule in enumerate(self._all_rules):
+            rule.rule_id = rule_id
+        self._any_pattern_re = fuse_rule_patterns(self._all_rules)
+        
+        # (候補クラス, 主要クラス)→適用ルール（重複なし）を全組み合わせ分作っておく
+        self._applicable_rules: Dict[Tuple[int, int], Tuple[SynergyRule, ...]] = {
+            (candidate_class, main_class): self._build_applicable_rules(candidate_class, main_class)
+            for candidate_class in range(CLASS_COUNT)
+            for main_class in range(CLASS_COUNT)
+        }
+
+    def _rule_masks(self, text: str) -> Tuple[int, int]:
+        """小文字化したテキストが一致するルールの(エネーブラー, ペイオフ)ビットマスク"""
+        enabler_mask = payoff_mask = 0
+        # どのパターンにも一致しないテキストはルールごとの照合を省く
+        if not self._any_pattern_re.search(text):
+            return enabler_mask, payoff_mask
+        
+        for rule in self._all_rules:
+            if rule.is_enabler(text):
+                enabler_mask |= 1 << rule.rule_id
+            if rule.is_payoff(text):
+                payoff_mask |= 1 << rule.rule_id
+        return enabler_mask, payoff_mask
+
+    def _get_conn(self) -> sqlite3.Connection:
+        """スレッドごとの読み取り専用SQLite接続を取得（初回のみ接続・PRAGMA設定）"""
+        conn = getattr(self._conn_local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            # ビルダーやログ書き込みと並行して読めるよう他の接続と同じWAL設定にそろえる
+            # （journal_modeの切り替えは書き込みになるためquery_onlyより先に行う）
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA query_only=1")
+            conn.execute("PRAGMA cache_size=-20000")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            self._conn_local.conn = conn
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
+
+    def close(self):
+        """開いているSQLite接続をすべて閉じる（以降の参照では接続し直す）"""
+        with self._conns_lock:
+            for conn in self._conns:
+                conn.close()
+            self._conns.clear()
+            self._conn_local = threading.local()
+
+    def refresh(self):
+        """カードデータ更新後にカード情報を読み込み直す"""
+        self._card_cache = {}
+        self._deck_cache.clear()
+        self._current_deck = None
+
+    def _get_cards(self, card_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """カード情報を取得（未キャッシュ分のみIN句でまとめて読み込む）"""
+        card_cache = self._card_cache
+        missing = [card_id for card_id in dict.fromkeys(card_ids) if card_id not in card_cache]
+        # SQLiteの変数上限を超えないようBULK_FETCH_CHUNK件ずつ問い合わせる
+        for start in range(0, len(missing), BULK_FETCH_CHUNK):
+            chunk = missing[start:start + BULK_FETCH_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            cursor = self._get_conn().execute(f"""
+                SELECT card_id, name, class_id, skill_text, evo_skill_text, card_type
+                FROM cards WHERE card_id IN ({placeholders})
+            """, chunk)
+            for row in cursor:
+                card = {
+                    'card_id': row[0],
+                    'name': row[1],
+                    'class_id': row[2],
+                    'skill_text': row[3] or '',
+                    'evo_skill_text': row[4] or '',
+                    'card_type': row[5] or ''  # 追加
+                }
+                # 能力テキストの結合・小文字化とルール判定は読み込み時に1回だけ行う
+                card['full_text_lc'] = f"{card['skill_text']} {card['evo_skill_text']}".lower()
+                card['enabler_mask'], card['payoff_mask'] = self._rule_masks(card['full_text_lc'])
+                card_cache[row[0]] = card
+        return card_cache
 
     def _initialize_synergy_rules(self) -> Dict[int, List[SynergyRule]]:
         """クラス別シナジールールを定義"""
@@ -84,29 +240,39 @@ class SynergyEngine:
         if not card_ids:
             return {"synergies": {}, "class_distribution": {}, "synergy_score": 0, "main_class": 0}
 
+        self.card_data.check()
+        # 主要クラスの同数判定が入力順に依存するためタプルをキーにする
+        deck_key = tuple(card_ids)
+        current = self._current_deck
+        if current is not None and current[0] == deck_key:
+            return current[1]
+        
+        result = self._deck_cache.get(deck_key)
+        if result is None:
+            result = self._analyze_deck_synergies(card_ids)
+            self._deck_cache.set(deck_key, result)
+        self._current_deck = (deck_key, result)
+        return result
+
+    def prepare(self, deck_card_ids: List[str]):
+        """ピック開始時にデッキ分析を済ませておく（候補ごとの評価は候補側の判定だけになる）"""
+        if deck_card_ids:
+            self.analyze_deck_synergies(deck_card_ids)
+
+    def _analyze_deck_synergies(self, card_ids: List[str]) -> Dict[str, Any]:
+        """デッキのシナジー分析（キャッシュなし）"""
+
         # カード情報を取得
         cards = []
         class_counts = {}
         
-        with sqlite3.connect(self.db_path) as conn:
-            for card_id in card_ids:
-                cursor = conn.execute("""
-                    SELECT card_id, name, class_id, skill_text, evo_skill_text, keywords, card_type
-                    FROM cards WHERE card_id = ?
-                """, (card_id,))
-                row = cursor.fetchone()
-                if row:
-                    card_data = {
-                        'card_id': row[0],
-                        'name': row[1],
-                        'class_id': row[2],
-                        'skill_text': row[3] or '',
-                        'evo_skill_text': row[4] or '',
-                        'keywords': json.loads(row[5] or '[]'),
-                        'card_type': row[6] or ''  # 追加
-                    }
-                    cards.append(card_data)
-                    class_counts[row[2]] = class_counts.get(row[2], 0) + 1
+        # デッキの並び（重複含む）でカード情報を揃える
+        cards_by_id = self._get_cards(card_ids)
+        for card_id in card_ids:
+            card_data = cards_by_id.get(card_id)
+            if card_data:
+                cards.append(card_data)
+                class_counts[card_data['class_id']] = class_counts.get(card_data['class_id'], 0) + 1
 
         # 主要クラスを特定（空の場合の安全処理）
         main_class = max(class_counts.keys(), key=lambda x: class_counts[x]) if class_counts else 0
@@ -116,27 +282,17 @@ class SynergyEngine:
         
         # 主要クラスのルールを適用
         for rule in self.synergy_rules.get(main_class, []) + self.synergy_rules.get(0, []):
+            bit = 1 << rule.rule_id
+            # ウィッチのスペルブーストルール専用パッチ
+            spell_enables = rule.name == "スペルブースト"
             enabler_count = 0
             payoff_count = 0
             
             for card in cards:
-                full_text = f"{card['skill_text']} {card['evo_skill_text']}"
-                
-                # ウィッチのスペルブーストルール専用パッチ
-                if rule.name == "スペルブースト" and card['card_type'] == 'spell':
+                if card['enabler_mask'] & bit or (spell_enables and card['card_type'] == 'spell'):
                     enabler_count += 1
-                else:
-                    # 既存のパターンマッチング
-                    for pattern in rule.enabler_patterns:
-                        if re.search(pattern, full_text, re.IGNORECASE):
-                            enabler_count += 1
-                            break
-                
-                # ペイオフ（既存のまま）
-                for pattern in rule.payoff_patterns:
-                    if re.search(pattern, full_text, re.IGNORECASE):
-                        payoff_count += 1
-                        break
+                if card['payoff_mask'] & bit:
+                    payoff_count += 1
 
             if enabler_count > 0 or payoff_count > 0:
                 synergy_counts[rule.name] = {
@@ -157,57 +313,57 @@ class SynergyEngine:
             "main_class": main_class
         }
 
+    def _build_applicable_rules(self, candidate_class: int, main_class: int) -> Tuple[SynergyRule, ...]:
+        """候補カードのクラス・主要クラス・ニュートラルのルール（同じルールは1回だけ）"""
+        chained = itertools.chain(self.synergy_rules.get(candidate_class, []),
+                                  self.synergy_rules.get(main_class, []),
+                                  self.synergy_rules.get(0, []))
+        return tuple({rule.rule_id: rule for rule in chained}.values())
+
+    def _rules_for(self, candidate_class: int, main_class: int) -> Tuple[SynergyRule, ...]:
+        """適用ルールを取得（想定外のクラスIDはその場で組み立てる）"""
+        rules = self._applicable_rules.get((candidate_class, main_class))
+        if rules is None:
+            rules = self._build_applicable_rules(candidate_class, main_class)
+        return rules
+
     def calculate_synergy_bonus(self, candidate_card_id: str, 
                                deck_card_ids: List[str], 
-                               pick_index: int) -> Tuple[float, List[str]]:
-        """候補カードのシナジーボーナスを計算"""
+                               pick_index: int,
+                               deck_synergies: Optional[Dict[str, Any]] = None) -> Tuple[float, List[str]]:
+        """候補カードのシナジーボーナスを計算（deck_synergiesは分析済みなら渡す）"""
         if not deck_card_ids:
             return 0.0, []
 
-        # デッキシナジー分析
-        deck_synergies = self.analyze_deck_synergies(deck_card_ids)
+        # デッキシナジー分析（候補ごとに同じデッキを再分析しない）
+        if deck_synergies is None:
+            deck_synergies = self.analyze_deck_synergies(deck_card_ids)
         main_class = deck_synergies["main_class"]
 
         # 候補カード情報取得
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute("""
-                SELECT name, class_id, skill_text, evo_skill_text, keywords
-                FROM cards WHERE card_id = ?
-            """, (candidate_card_id,))
-            row = cursor.fetchone()
-            
-            if not row:
-                return 0.0, []
-            
-            candidate = {
-                'name': row[0],
-                'class_id': row[1],
-                'skill_text': row[2] or '',
-                'evo_skill_text': row[3] or '',
-                'keywords': json.loads(row[4] or '[]')
-            }
+        candidate = self._get_cards([candidate_card_id]).get(candidate_card_id)
+        if not candidate:
+            return 0.0, []
+
+        # どのルールにも一致しない候補はボーナスなし
+        enabler_mask = candidate['enabler_mask']
+        payoff_mask = candidate['payoff_mask']
+        if not (enabler_mask or payoff_mask):
+            return 0.0, []
 
         total_bonus = 0.0
         reasons = []
-        candidate_text = f"{candidate['skill_text']} {candidate['evo_skill_text']}"
+        synergies = deck_synergies["synergies"]
 
-        # 候補カードのクラスまたは主要クラスのルールを適用
-        applicable_rules = (self.synergy_rules.get(candidate['class_id'], []) + 
-                          self.synergy_rules.get(main_class, []) + 
-                          self.synergy_rules.get(0, []))
-
-        for rule in applicable_rules:
-            synergy_data = deck_synergies["synergies"].get(rule.name)
+        for rule in self._rules_for(candidate['class_id'], main_class):
+            # デッキに該当カードがないルールは集計に含まれない
+            synergy_data = synergies.get(rule.name)
             if not synergy_data:
                 continue
 
-            # このカードがルールに一致するかチェック
-            is_enabler = any(re.search(pattern, candidate_text, re.IGNORECASE) 
-                           for pattern in rule.enabler_patterns)
-            is_payoff = any(re.search(pattern, candidate_text, re.IGNORECASE) 
-                          for pattern in rule.payoff_patterns)
-
-            if is_payoff and synergy_data['enablers'] >= rule.min_threshold:
+            # 条件を満たす側だけ候補のビットを調べる
+            if (synergy_data['enablers'] >= rule.min_threshold
+                    and payoff_mask >> rule.rule_id & 1):
                 # ペイオフカード: 基盤が十分にある場合
                 bonus = min(synergy_data['enablers'] * rule.bonus_per_card, rule.max_bonus)
                 # ピック進行度による調整
@@ -216,7 +372,7 @@ class SynergyEngine:
                 total_bonus += bonus
                 reasons.append(f"{rule.name}活用 (+{bonus:.1f}点, 基盤{synergy_data['enablers']}枚)")
                 
-            elif is_enabler and synergy_data['payoffs'] > 0:
+            elif synergy_data['payoffs'] > 0 and enabler_mask >> rule.rule_id & 1:
                 # エネーブラー: ペイオフカードがある場合
                 bonus = min(synergy_data['payoffs'] * (rule.bonus_per_card * 0.7), 
                           rule.max_bonus * 0.6)
@@ -226,4 +382,4 @@ class SynergyEngine:
                 total_bonus += bonus
                 reasons.append(f"{rule.name}基盤強化 (+{bonus:.1f}点)")
 
-        return round(total_bonus, 1), reasons
+        return total_bonus, reasons
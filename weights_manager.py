@@ -1,6 +1,7 @@
 # weights_manager.py
 import json
 import os
+import tempfile
 from typing import Dict, Any
 from config import WEIGHTS_FILE, DEFAULT_WEIGHTS
 
@@ -8,6 +9,8 @@ class WeightsManager:
     def __init__(self):
         self.weights_file = WEIGHTS_FILE
         self.weights = self._load_weights()
+        # 重みが変わるたびに増える世代番号（利用側のキャッシュ無効化用）
+        self.version = 0
     
     def _load_weights(self) -> Dict[str, float]:
         """重み設定を読み込み"""
@@ -25,24 +28,44 @@ class WeightsManager:
             return DEFAULT_WEIGHTS['weights']
     
     def _save_weights(self, weights: Dict[str, float]):
-        """重み設定を保存"""
+        """重み設定を保存（同じディレクトリの一時ファイルに書いてから置き換える）"""
         data = {
             "version": DEFAULT_WEIGHTS['version'],
             "weights": weights
         }
-        with open(self.weights_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(self.weights_file) or '.', suffix='.json'
+        )
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            # mkstempは0600で作るため、置き換え前に元ファイルの権限（なければ0644）にそろえる
+            try:
+                mode = os.stat(self.weights_file).st_mode & 0o777
+            except FileNotFoundError:
+                mode = 0o644
+            os.chmod(tmp_path, mode)
+            os.replace(tmp_path, self.weights_file)
+        except BaseException:
+            # 書き込み途中で失敗しても元のファイルは壊さない
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
     def get_weights(self) -> Dict[str, float]:
         """現在の重みを取得"""
         return self.weights.copy()
     
     def update_weights(self, new_weights: Dict[str, float]):
-        """重みを更新"""
+        """重みを更新（値が変わらなければ保存しない）"""
+        if all(k in self.weights and self.weights[k] == v for k, v in new_weights.items()):
+            return
         self.weights.update(new_weights)
+        self.version += 1
         self._save_weights(self.weights)
     
     def reset_to_default(self):
         """デフォルト重みにリセット"""
         self.weights = DEFAULT_WEIGHTS['weights'].copy()
+        self.version += 1
         self._save_weights(self.weights)
@@ -2,6 +2,8 @@
 import sqlite3
 import json
 import math
+import numpy as np
+from collections import Counter
 from typing import Dict, List, Any
 from config import DB_PATH
 
@@ -17,6 +19,21 @@ class WinRatePredictor:
             'role_coverage': 0.15,   # 役割カバー率
             'consistency': 0.10      # デッキの一貫性
         }
+        # 加重合計用に重みを固定順で展開しておく
+        self._w_avg = self.factors['avg_rating']
+        self._w_curve = self.factors['curve_quality']
+        self._w_syn = self.factors['synergy_strength']
+        self._w_role = self.factors['role_coverage']
+        self._w_cons = self.factors['consistency']
+        
+        # 理想マナカーブ（1〜6コスト）を30枚あたりの割合にしたもの
+        ideal_curve = {1: 4, 2: 6, 3: 6, 4: 5, 5: 4, 6: 2}
+        self._scaled_ideal = [(cost, count / 30.0) for cost, count in ideal_curve.items()]
+        self._ideal_len = len(ideal_curve)
+        
+        # 重要役割と目標枚数
+        self._important_roles = ('removal', 'draw', 'finisher', 'protection')
+        self._role_targets = np.array([3, 2, 2, 2], dtype=np.float64)
     
     def predict_win_rate(self, deck_card_ids: List[str], 
                         deck_analysis: Dict[str, Any]) -> Dict[str, Any]:
@@ -45,7 +62,12 @@ class WinRatePredictor:
         factors['consistency'] = self._evaluate_consistency(deck_card_ids)
         
         # 重み付き合計
-        weighted_score = sum(factors[k] * self.factors[k] for k in factors.keys())
+        f = factors
+        weighted_score = (f['avg_rating'] * self._w_avg
+                          + f['curve_quality'] * self._w_curve
+                          + f['synergy_strength'] * self._w_syn
+                          + f['role_coverage'] * self._w_role
+                          + f['consistency'] * self._w_cons)
         
         # 勝率に変換（35-75%の範囲）
         win_rate = 35 + (weighted_score * 40)
@@ -67,34 +89,23 @@ class WinRatePredictor:
     
     def _evaluate_curve_quality(self, curve: Dict[int, int]) -> float:
         """マナカーブの質を評価"""
-        ideal = {1: 4, 2: 6, 3: 6, 4: 5, 5: 4, 6: 2}
         total_cards = sum(curve.values())
         
         if total_cards == 0:
             return 0.5
         
-        quality = 0
-        for cost, ideal_count in ideal.items():
-            current = curve.get(cost, 0)
-            expected = ideal_count * (total_cards / 30)
-            
-            # 理想との差が小さいほど高評価
-            diff = abs(current - expected)
-            cost_quality = max(0, 1 - diff / 3)
-            quality += cost_quality
-        
-        return quality / len(ideal)
+        # 理想との差が小さいほど高評価（6要素ならNumPy配列を作るより速い）
+        quality = sum(
+            max(0, 1 - abs(curve.get(cost, 0) - scaled * total_cards) / 3)
+            for cost, scaled in self._scaled_ideal
+        )
+        return quality / self._ideal_len
     
     def _evaluate_role_coverage(self, roles: Dict[str, int]) -> float:
         """役割カバー率を評価"""
-        important_roles = {'removal': 3, 'draw': 2, 'finisher': 2, 'protection': 2}
-        coverage = 0
-        
-        for role, target in important_roles.items():
-            current = roles.get(role, 0)
-            coverage += min(current / target, 1.0)
-        
-        return coverage / len(important_roles)
+        current = np.array([roles.get(role, 0) for role in self._important_roles], dtype=np.float64)
+        coverage = np.minimum(current / self._role_targets, 1.0)
+        return float(coverage.mean())
     
     def _evaluate_consistency(self, deck_card_ids: List[str]) -> float:
         """デッキの一貫性を評価"""
@@ -102,10 +113,7 @@ class WinRatePredictor:
             return 0.5
         
         # 重複カードの評価
-        card_counts = {}
-        for card_id in deck_card_ids:
-            card_counts[card_id] = card_counts.get(card_id, 0) + 1
-        
+        card_counts = Counter(deck_card_ids)
         duplicates = sum(1 for count in card_counts.values() if count >= 2)
         duplicate_score = min(duplicates / 4, 1.0)
         